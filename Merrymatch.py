@@ -1,52 +1,189 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
+import perf
 from datetime import datetime
+import os
+import time
 
 from donation import Donation
 from wish import Wish
+from matcher import find_matches, apply_match, STRATEGIES
+from background import BackgroundWorker, report_each
+from stats import RecordStats, MatchSummary, category_breakdown
+from normalize import ItemNormalizer, load_synonyms
+import exporter
 
 from data_manager import (
-    load_donations,
-    load_wishes,
+    iter_donations,
+    iter_wishes,
     save_donations,
     save_wishes,
     add_donation as db_add_donation,
     add_wish as db_add_wish,
     update_donation as db_update_donation,
     update_wish as db_update_wish,
+    get_donation,
+    get_wish,
     delete_donation as db_delete_donation,
     delete_wish as db_delete_wish,
+    save_match_results,
+    pending_match_keys,
+    load_open_donations,
+    load_open_wishes,
+    search_donations,
+    search_wishes,
+    count_donations,
+    count_wishes,
+    enable_write_behind,
+    disable_write_behind,
+    flush_writes,
+    pending_writes,
+    close_connections,
 )
 
+perf.mark("imports")
+
+#tkinter (and VirtualTable/TableSearch/MatchResults, which need it) is only
+#imported by load_tk(), so importing this module for its helpers stays light
+tk = ttk = messagebox = VirtualTable = TableSearch = MatchResults = None
+
+def load_tk():
+    global tk, ttk, messagebox, VirtualTable, TableSearch, MatchResults
+    if tk is None:
+        import tkinter
+        from tkinter import ttk as tk_ttk, messagebox as tk_messagebox
+        from virtual_table import VirtualTable as table_class
+        from table_search import TableSearch as search_class
+        from results_view import MatchResults as results_class
+        tk, ttk, messagebox, VirtualTable, TableSearch, MatchResults = (
+            tkinter, tk_ttk, tk_messagebox, table_class, search_class, results_class)
+        perf.mark("tkinter loaded")
+
+#Categories offered in the add/edit dialog
+CATEGORIES = ["Toys", "Clothes", "Food", "Books", "Electronics", "Other"]
+
+#Set MERRYMATCH_WRITE_BEHIND=1 to buffer adds/edits/deletes and write them
+#together every WRITE_BEHIND_FLUSH_MS (see data_manager.enable_write_behind)
+WRITE_BEHIND_ENV = "MERRYMATCH_WRITE_BEHIND"
+WRITE_BEHIND_FLUSH_MS = 2000
+
+#Processes for large matching runs (see matcher.allocate_partitioned); the
+#plan is the same as with one, and small runs always stay in this process
+MATCH_WORKERS = os.cpu_count() or 1
+
+#Optional extra synonyms for fuzzy matching ({"word or phrase": "canonical form"})
+SYNONYMS_FILE = "synonyms.json"
+
+#What the EXPORT button can write: choice -> (exporter kind, file extension)
+EXPORT_CHOICES = {
+    "Match results": ("matches", ".csv"),
+    "Pick list": ("picklist", ".txt"),
+    "Outstanding wishes": ("outstanding", ".csv"),
+    "Donations": ("donations", ".csv"),
+    "Wishes": ("wishes", ".csv"),
+}
+
+#Column values shown for each record in the tables
+def donation_row(d):
+    return (d.donor, d.item, d.quantity, d.category, d.status, d.date)
+
+def wish_row(w):
+    return (w.recipient, w.item, w.quantity, w.category, w.status, w.date)
+
+def plan_match(task, normalizer, strategy):
+    #Runs on the background worker. Exact matching only looks at records whose
+    #(category, item) changed since the last run; fuzzy matching can pair
+    #names across keys, so it always looks at everything. Records are read
+    #from the database, not taken from the loaded lists, so rows another
+    #station added take part too; _finish_match swaps in the loaded objects.
+    claim, queued = pending_match_keys()
+    if normalizer is None and queued is not None:
+        donations = load_open_donations(queued)
+        wishes = load_open_wishes(queued)
+    else:
+        donations = [d for chunk in iter_donations(status="Available") for d in chunk]
+        wishes = [w for chunk in iter_wishes(status="Pending") for w in chunk]
+    allocations = find_matches(donations, wishes, progress=task.report,
+                               normalizer=normalizer, strategy=strategy, workers=MATCH_WORKERS)
+    return allocations, claim if queued else None
+
+def export_file(task, kind, path):
+    #Runs on the background worker, after every write queued before it
+    return path, exporter.export(kind, path, progress=task.report)
+
 #MAIN APPLICATION 
 
 class Merrymatch:
     def __init__(self, root):
+        load_tk()
         self.root = root
         #Set main window properties 
         self.root.title("THANK YOU MERRY MATCH! DONATION & WISH LIST TRACKER")
         self.root.geometry("1000x700") 
         self.root.configure(bg="white") 
 
-        #Load data from the database upon startup
-        self.donations = load_donations() # list for Donation objects
-        self.wishes = load_wishes()    # list for Wish objects
+        #Records stream in from the database once the window is up (see load_records)
+        self.donations = [] # list for Donation objects
+        self.wishes = []    # list for Wish objects
+
+        #Row id -> object indexes for O(1) lookups from the tables
+        self.donations_by_id = {}
+        self.wishes_by_id = {}
+
+        #Running totals behind the stats labels, updated on every change
+        self.donation_totals = RecordStats("Available")
+        self.wish_totals = RecordStats("Pending")
+
+        #Ids removed from the lists whose DELETE has not reached the database yet
+        self.deleted_donation_ids = set()
+        self.deleted_wish_ids = set()
         
+        #Database writes and matching run here so the window stays responsive
+        self.worker = BackgroundWorker(self.root)
+        #Table searches get their own thread so a long match doesn't hold them up
+        self.search_worker = BackgroundWorker(self.root)
+        self.match_task = None
+        self.export_task = None
+        self.match_started = 0.0
+        self.loads_running = 0
+
         #Hook the save function to the window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+        #Hidden diagnostics window (perf figures), toggled with Ctrl+Shift+D
+        self.diagnostics = None
+        self.root.bind_all("<Control-Shift-D>", self.toggle_diagnostics)
+        self.root.bind_all("<Control-Shift-d>", self.toggle_diagnostics)
         
         self.setup_ui()
         self.refresh_all()
+        perf.mark("window built")
+        #Queued ahead of the loads, so a journal left by a crash is written first
+        if os.environ.get(WRITE_BEHIND_ENV) == "1":
+            self.worker.submit(enable_write_behind, on_done=self._write_behind_started)
+        self.load_records()
 
     def on_closing(self):
         try:
-            #Save the current state of donations and wishes lists
-            save_donations(self.donations)
-            save_wishes(self.wishes)
-            messagebox.showinfo("Data Saved", "All changes have been successfully saved to the database. BYE BYE!")
+            #Let queued background writes finish first
+            if self.match_task is not None:
+                self.match_task.cancel()
+            if self.export_task is not None:
+                self.export_task.cancel()
+            self.worker.shutdown()
+            self.search_worker.shutdown()
+
+            #Save only new, edited and deleted rows that are not in the database yet
+            #(this also writes out anything still in the write-behind buffer)
+            saved = (save_donations(self.donations, self.deleted_donation_ids) and
+                     save_wishes(self.wishes, self.deleted_wish_ids))
+            saved = disable_write_behind() and saved
+            if saved:
+                messagebox.showinfo("Data Saved", "All changes have been successfully saved to the database. BYE BYE!")
+            else:
+                messagebox.showerror("Save Error", "Some changes could not be saved to the database.")
         except Exception as e:
             messagebox.showerror("Save Error", f"An error occurred while saving data: {e}")
         finally:
+            close_connections()
             self.root.destroy()
 
     def setup_ui(self):
@@ -99,6 +236,11 @@ class Merrymatch:
 
         btn_frame.columnconfigure(0, weight=1) 
 
+        #Past seasons are only loaded when asked for
+        self.donation_history_button = tk.Button(btn_frame, text="LOAD PAST SEASONS",
+                command=self.load_donation_history, font=("fixedsys", 10))
+        self.donation_history_button.grid(row=0, column=0, padx=5, pady=7, sticky="w")
+
         #Buttons with commands  
         tk.Button(btn_frame, text="ADD DONATION", command=self.add_donation,
                 bg="#A3D78A", font=("fixedsys", 10)).grid(row=0, column=1, padx=5, pady=7, sticky="e")
@@ -109,20 +251,22 @@ class Merrymatch:
 
         #Treeview/Table for displaying data
         columns = ("donor", "item", "quantity", "category", "status", "date")
-        self.donation_tree = ttk.Treeview(self.donations_frame, columns=columns, 
-                                         show="headings", height=15)
-        #Column headings
-        self.donation_tree.heading("donor", text="Donor Name")
-        self.donation_tree.heading("item", text="Item")
-        self.donation_tree.heading("quantity", text="Quantity") 
-        self.donation_tree.heading("category", text="Category")
-        self.donation_tree.heading("status", text="Status")
-        self.donation_tree.heading("date", text="Date")
+        self.donation_view = VirtualTable(self.donations_frame, columns, donation_row, height=15)
+        self.donation_tree = self.donation_view.tree
+        #Search box and column headings (click to sort)
+        headings = {"donor": "Donor Name", "item": "Item", "quantity": "Quantity",
+                    "category": "Category", "status": "Status", "date": "Date"}
+        self.donation_search = TableSearch(
+            self.donations_frame, self.donation_view, headings, search_donations,
+            count_donations, self.search_worker,
+            self._search_results(self.donations, self.donations_by_id,
+                                 self.donation_totals, self.deleted_donation_ids))
+        self.donation_search.pack(fill="x", padx=5)
         
         #Configure column widths and alignment
         self.donation_tree.column("quantity", width=80, anchor="center")
         self.donation_tree.column("status", width=100, anchor="center")
-        self.donation_tree.pack(pady=10, fill="both", expand=True, padx=5)
+        self.donation_view.pack(pady=10, fill="both", expand=True, padx=5)
 
         #Stats Label
         self.donation_stats = tk.Label(self.donations_frame, text="", 
@@ -136,6 +280,11 @@ class Merrymatch:
 
         btn_frame.columnconfigure(0, weight=1) 
 
+        #Past seasons are only loaded when asked for
+        self.wish_history_button = tk.Button(btn_frame, text="LOAD PAST SEASONS",
+                 command=self.load_wish_history, font=("fixedsys", 10))
+        self.wish_history_button.grid(row=0, column=0, padx=5, pady=7, sticky="w")
+
         #Buttons with commands (ADD, EDIT, DELETE)
         tk.Button(btn_frame, text="ADD WISH", command=self.add_wish, 
                  bg="#A3D78A", font=("fixedsys", 10)).grid(row=0, column=1, padx=5, pady=7, sticky="e")
@@ -146,20 +295,23 @@ class Merrymatch:
 
         #Treeview/Table for displaying data
         columns = ("recipient", "item", "quantity", "category", "status", "date")
-        self.wish_tree = ttk.Treeview(self.wishes_frame, columns=columns, 
-                                     show="headings", height=15)
-        self.wish_tree.heading("recipient", text="Recipient Name")
-        self.wish_tree.heading("item", text="Item Needed")
-        self.wish_tree.heading("quantity", text="Quantity")
-        self.wish_tree.heading("category", text="Category")
-        self.wish_tree.heading("status", text="Status")
-        self.wish_tree.heading("date", text="Date")
+        self.wish_view = VirtualTable(self.wishes_frame, columns, wish_row, height=15)
+        self.wish_tree = self.wish_view.tree
+        #Search box and column headings (click to sort)
+        headings = {"recipient": "Recipient Name", "item": "Item Needed", "quantity": "Quantity",
+                    "category": "Category", "status": "Status", "date": "Date"}
+        self.wish_search = TableSearch(
+            self.wishes_frame, self.wish_view, headings, search_wishes,
+            count_wishes, self.search_worker,
+            self._search_results(self.wishes, self.wishes_by_id,
+                                 self.wish_totals, self.deleted_wish_ids))
+        self.wish_search.pack(fill="x", padx=5)
 
         #Configure helpful column widths and alignment
         self.wish_tree.column("quantity", width=80, anchor="center")
         self.wish_tree.column("status", width=100, anchor="center")
 
-        self.wish_tree.pack(pady=10, fill="both", expand=True, padx=5)
+        self.wish_view.pack(pady=10, fill="both", expand=True, padx=5)
 
         #Stats Label
         self.wish_stats = tk.Label(self.wishes_frame, text="", 
@@ -173,37 +325,167 @@ class Merrymatch:
                 font=("fixedsys", 14, "bold"), fg="purple").pack(pady=7)
 
         #Button for matching logic
-        tk.Button(self.matching_frame, text="AUTO MATCH GIFTS", 
+        self.match_button = tk.Button(self.matching_frame, text="AUTO MATCH GIFTS", 
                  command=self.auto_match, bg="#DDA0DD", 
-                 font=("fixedsys", 12, "bold"), height=3, width=20).pack(pady=10)
+                 font=("fixedsys", 12, "bold"), height=3, width=20)
+        self.match_button.pack(pady=10)
+
+        #Fuzzy matching also pairs "Teddy Bear" with "teddy bears" and similar names
+        self.fuzzy_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.matching_frame, text="Fuzzy item names", variable=self.fuzzy_var,
+                       font=("fixedsys", 10)).pack()
+
+        #How donations are shared out when there are not enough for every wish
+        strategy_frame = tk.Frame(self.matching_frame)
+        strategy_frame.pack()
+        tk.Label(strategy_frame, text="Strategy:", font=("fixedsys", 10)).pack(side="left")
+        self.strategy_var = tk.StringVar(value=STRATEGIES[0])
+        ttk.Combobox(strategy_frame, textvariable=self.strategy_var, values=STRATEGIES,
+                     state="readonly", width=14).pack(side="left", padx=5)
+
+        #Progress of a running match, with a button to stop it
+        progress_frame = tk.Frame(self.matching_frame)
+        progress_frame.pack(fill="x", padx=5)
+        self.match_progress = ttk.Progressbar(progress_frame, mode="determinate")
+        self.match_progress.pack(side="left", fill="x", expand=True, padx=5)
+        self.cancel_match_button = tk.Button(progress_frame, text="Cancel", 
+                 command=self.cancel_match, state="disabled", font=("fixedsys", 10))
+        self.cancel_match_button.pack(side="right", padx=5)
         
         #Text area to display matching results
         self.match_text = tk.Text(self.matching_frame, height=15, width=80, 
                                  font=("fixedsys", 10), relief=tk.SUNKEN, bd=2)
         self.match_text.pack(pady=10, fill="both", expand=True, padx=5)
+        self.match_results = MatchResults(self.match_text)
+
+        #Available vs pending quantity per category
+        self.breakdown_label = tk.Label(self.matching_frame, text="", justify="left",
+                                        font=("fixedsys", 10), fg="#B45253")
+        self.breakdown_label.pack(pady=5)
 
         #Button to clear the results text area
         tk.Button(self.matching_frame, text="Clear Matches", 
                  command=self.clear_matches, bg="#FF5555", font=("fixedsys", 10)).pack(pady=5)
 
-    #Utility Functions for Object Retrieval
-    def find_donation_by_keys(self, donor, item, date):
-        #Finds a Donation object in the list using its key attributes
-
-        for d in self.donations:
-            if d.donor == donor and d.item == item and d.date == date:
-                return d
-        return None
+        #Export straight from the database to a file (see exporter.py)
+        export_frame = tk.Frame(self.matching_frame)
+        export_frame.pack(pady=5)
+        tk.Label(export_frame, text="Export:", font=("fixedsys", 10)).pack(side="left")
+        self.export_var = tk.StringVar(value=next(iter(EXPORT_CHOICES)))
+        ttk.Combobox(export_frame, textvariable=self.export_var, values=list(EXPORT_CHOICES),
+                     state="readonly", width=18).pack(side="left", padx=5)
+        self.export_button = tk.Button(export_frame, text="EXPORT...", command=self.export_data,
+                                       bg="#DDA0DD", font=("fixedsys", 10))
+        self.export_button.pack(side="left", padx=5)
+        self.export_label = tk.Label(export_frame, text="", font=("fixedsys", 10))
+        self.export_label.pack(side="left", padx=5)
+
+    #Write-behind
+    def _write_behind_started(self, started):
+        if started:
+            self.root.after(WRITE_BEHIND_FLUSH_MS, self._flush_writes)
+        else:
+            messagebox.showwarning("Database", "Could not start write-behind; "
+                                   "changes are written one at a time instead.")
+
+    def _flush_writes(self):
+        #Every WRITE_BEHIND_FLUSH_MS: writes out the buffered changes on the worker
+        self.root.after(WRITE_BEHIND_FLUSH_MS, self._flush_writes)
+        if pending_writes():
+            self.worker.submit(flush_writes, on_done=self._writes_flushed)
+
+    def _writes_flushed(self, refused):
+        #Buffered edits refused because the row changed at another station
+        #meanwhile are handled like a refused direct UPDATE (None: the write
+        #failed; it stays journaled and is tried again on the next tick)
+        for record in refused or ():
+            is_donation = isinstance(record, Donation)
+            self.worker.submit(get_donation if is_donation else get_wish, record.id,
+                               on_done=self._edit_refused(record, is_donation))
+
+    #Loading
+    def load_records(self):
+        #Streams this season's donations and wishes in on the background worker.
+        #Each chunk is listed as soon as it arrives.
+        self._stream_records(iter_donations(), self.donations, self.donations_by_id,
+                             self.donation_view, self.donation_totals)
+        self._stream_records(iter_wishes(), self.wishes, self.wishes_by_id,
+                             self.wish_view, self.wish_totals)
+
+    def load_donation_history(self):
+        #Handler for LOAD PAST SEASONS on the Donations tab
+        self.donation_history_button.config(state="disabled")
+        self._stream_records(iter_donations(history=True), self.donations,
+                             self.donations_by_id, self.donation_view, self.donation_totals)
+
+    def load_wish_history(self):
+        #Handler for LOAD PAST SEASONS on the Wish List tab
+        self.wish_history_button.config(state="disabled")
+        self._stream_records(iter_wishes(history=True), self.wishes,
+                             self.wishes_by_id, self.wish_view, self.wish_totals)
+
+    def _stream_records(self, chunks, records, index, view, totals):
+        def add_chunk(chunk):
+            chunk = [r for r in chunk if r.id not in index]
+            records.extend(chunk)
+            index.update((r.id, r) for r in chunk)
+            totals.add_many(chunk)
+            view.refresh()
+            self.update_stats()
+
+        def finished(*_):
+            self.loads_running -= 1
+            self._update_match_button()
+            self.refresh_all()
+            if self.loads_running == 0:
+                perf.mark("records loaded")
+                perf.print_startup_report()
+
+        self.loads_running += 1
+        self._update_match_button()
+        self.worker.submit(report_each, chunks, with_task=True, on_progress=add_chunk,
+                           on_done=finished, on_error=self._load_failed(finished))
+
+    def _search_results(self, records, index, totals, pending_deletes):
+        #resolve() for a TableSearch: swaps each row for the loaded object with
+        #the same id, so edits and matching only ever see one copy. Rows from
+        #seasons that are not loaded yet are added to the list as they show up.
+        def resolve(rows):
+            count = len(records)
+            shown = [self._loaded_record(row, records, index, totals, pending_deletes) for row in rows]
+            if len(records) > count:
+                self.update_stats()
+            return [record for record in shown if record is not None]
+        return resolve
+
+    def _loaded_record(self, row, records, index, totals, pending_deletes):
+        #The loaded object with row's id, or None if it is being deleted. A row
+        #that is not loaded yet (an older season, another station's) is added.
+        if row.id in pending_deletes:
+            return None
+        record = index.get(row.id)
+        if record is None:
+            record = index[row.id] = row
+            records.append(row)
+            totals.add(row)
+        return record
+
+    def _load_failed(self, finished):
+        def failed(error):
+            finished()
+            messagebox.showerror("Database", f"Could not load records: {error}")
+        return failed
 
-    def find_wish_by_keys(self, recipient, item, date):
-        #Finds a Wish object in the list using its key attributes
+    #Utility Functions for Object Retrieval
+    def find_donation_by_id(self, donation_id):
+        #Finds a Donation object using its database row id
+        return self.donations_by_id.get(donation_id)
 
-        for w in self.wishes:
-            if w.recipient == recipient and w.item == item and w.date == date:
-                return w
-        return None
+    def find_wish_by_id(self, wish_id):
+        #Finds a Wish object using its database row id
+        return self.wishes_by_id.get(wish_id)
 
-    def _show_dialog(self, title, initial_data=None, is_donation=True, item_to_edit=None, original_keys=None):
+    def _show_dialog(self, title, initial_data=None, is_donation=True, item_to_edit=None):
         #Dialog for adding and editing items
 
         #Create a new top-level window for the dialog
@@ -238,10 +520,9 @@ class Merrymatch:
         #Category Dropdown
         tk.Label(dialog, text="Category:", font=("fixedsys", 10)).pack(pady=5)
         cat_var = tk.StringVar(value=initial_data.get('category', 'Toys') if initial_data else 'Toys')
-        categories = ["Toys", "Clothes", "Food", "Books", "Electronics", "Other"]
         style = ttk.Style()
         style.configure('TCombobox', font=('fixedsys', 10), fieldbackground='white')
-        combo = ttk.Combobox(dialog, textvariable=cat_var, values=categories, state="readonly", style='TCombobox', font=('fixedsys', 10))
+        combo = ttk.Combobox(dialog, textvariable=cat_var, values=CATEGORIES, state="readonly", style='TCombobox', font=('fixedsys', 10))
         combo.pack()
 
         def save():
@@ -268,10 +549,6 @@ class Merrymatch:
 
             if item_to_edit:
                 #EDIT Logic: Update attributes of the existing object
-                old_keys = original_keys or (
-                    (item_to_edit.donor, item_to_edit.item, item_to_edit.date)
-                )
-
                 if is_donation:
                     item_to_edit.donor = name
                 else:
@@ -290,16 +567,18 @@ class Merrymatch:
                 else:
                     #If quantity is set to 0, mark as complete
                     item_to_edit.status = "Matched" if is_donation else "Fulfilled" 
+                (self.donation_totals if is_donation else self.wish_totals).update(item_to_edit)
 
                 #Persist change immediately with UPDATE to keep DB in sync
-                updated = (
-                    db_update_donation(*old_keys, item_to_edit)
-                    if is_donation else db_update_wish(*old_keys, item_to_edit)
-                )
-                if updated:
-                    messagebox.showinfo("Success", f"{'Donation' if is_donation else 'Wish'} updated!")
-                else:
-                    messagebox.showwarning("Database", "Update did not save to the database.")
+                def update_done(updated):
+                    if updated:
+                        messagebox.showinfo("Success", f"{'Donation' if is_donation else 'Wish'} updated!")
+                    else:
+                        self.worker.submit(get_donation if is_donation else get_wish, item_to_edit.id,
+                                           on_done=self._edit_refused(item_to_edit, is_donation))
+
+                self.worker.submit(db_update_donation if is_donation else db_update_wish,
+                                   item_to_edit, on_done=update_done)
 
             else:
                 #ADD Logic: Create a new object and append it to the list
@@ -307,25 +586,86 @@ class Merrymatch:
 
                 if is_donation:
                     new_item = Donation(name, item, qty, category, status, date)
-                    self.donations.append(new_item)
-                    db_add_donation(new_item)
-                    messagebox.showinfo("Success", "Donation added! Thank you! 🎁")
                 else:
                     new_item = Wish(name, item, qty, category, status, date)
-                    self.wishes.append(new_item)
-                    db_add_wish(new_item)
-                    messagebox.showinfo("Success", "Wish added! ⭐")
+
+                #Saved first so the new row has its id before it is listed
+                def add_done(added):
+                    if not added:
+                        messagebox.showerror("Database", f"{'Donation' if is_donation else 'Wish'} could not be saved to the database.")
+                        if save_button.winfo_exists():
+                            save_button.config(state="normal")
+                        return
+                    if is_donation:
+                        self.donations.append(new_item)
+                        self.donation_totals.add(new_item)
+                        self.donations_by_id[new_item.id] = new_item
+                        messagebox.showinfo("Success", "Donation added! Thank you! 🎁")
+                    else:
+                        self.wishes.append(new_item)
+                        self.wish_totals.add(new_item)
+                        self.wishes_by_id[new_item.id] = new_item
+                        messagebox.showinfo("Success", "Wish added! ⭐")
+                    self.refresh_all() #Update the visible list/table
+                    (self.donation_search if is_donation else self.wish_search).rerun()
+                    dialog.destroy()
+
+                save_button.config(state="disabled")
+                self.worker.submit(db_add_donation if is_donation else db_add_wish,
+                                   new_item, on_done=add_done)
+                return
             
-            self.refresh_all() #Update the visible list/table
+            self._refresh_record(item_to_edit, is_donation) #Update the edited row
             dialog.destroy()
 
         #Save Button
         save_button_text = "Save Changes" if item_to_edit else ("Save Donation" if is_donation else "Save Wish")
         save_button_color = "#ADD8E6" if item_to_edit else ("#90EE90" if is_donation else "#FFE4B5")
         
-        tk.Button(dialog, text=save_button_text, command=save, 
-                 bg=save_button_color, font=("fixedsys", 10, "bold")).pack(pady=15)
-
+        save_button = tk.Button(dialog, text=save_button_text, command=save, 
+                 bg=save_button_color, font=("fixedsys", 10, "bold"))
+        save_button.pack(pady=15)
+
+
+    def _edit_refused(self, record, is_donation):
+        #The UPDATE for an edit did not go in: the row was changed or deleted
+        #at another station since it was loaded, or the write failed. Shows
+        #what the database holds now (stored comes from get_donation/get_wish).
+        def done(stored):
+            label = "donation" if is_donation else "wish"
+            if stored is False:
+                messagebox.showwarning("Database", "Update did not save to the database.")
+                return
+            totals = self.donation_totals if is_donation else self.wish_totals
+            if stored is None:
+                records, index = ((self.donations, self.donations_by_id) if is_donation
+                                  else (self.wishes, self.wishes_by_id))
+                if index.pop(record.id, None) is not None:
+                    totals.remove(record)
+                    records.remove(record)
+                (self.donation_view if is_donation else self.wish_view).discard(record)
+                message = f"This {label} was deleted at another station."
+                self.refresh_all()
+            else:
+                record.copy_from(stored)
+                totals.update(record)
+                message = (f"This {label} was changed at another station, so your edit was not saved. "
+                           "The table now shows the saved version; edit it again if needed.")
+                self._refresh_record(record, is_donation)
+            messagebox.showwarning("Changed Elsewhere", message)
+        return done
+
+    def _refresh_record(self, record, is_donation):
+        #After one record was edited: rewrites just its row and the stats
+        #labels. The loaded list's order does not depend on the values, but
+        #search results are in database order (a sorted column) and only
+        #hold rows that match, so the search is run again instead.
+        view = self.donation_view if is_donation else self.wish_view
+        if view.querying():
+            (self.donation_search if is_donation else self.wish_search).rerun()
+        else:
+            view.refresh_record(record)
+        self.update_stats()
 
     #CRUD Functions
     def add_donation(self):
@@ -343,14 +683,11 @@ class Merrymatch:
             messagebox.showwarning("Select", "Please select a donation to edit.")
             return
 
-        #Get the tag to find the index
-        tags = self.donation_tree.item(selected[0])["tags"]
-        if not tags:
+        #Get the row id from the tag
+        donation_to_edit = self.donation_view.selected_record()
+        if donation_to_edit is None:
             messagebox.showerror("Error", "Could not identify donation.")
             return
-        
-        donation_idx = int(tags[0].split("_")[1])
-        donation_to_edit = self.donations[donation_idx]
 
         initial_data = {
             'name': donation_to_edit.donor,
@@ -363,7 +700,6 @@ class Merrymatch:
             initial_data=initial_data,
             is_donation=True,
             item_to_edit=donation_to_edit,
-            original_keys=(donation_to_edit.donor, donation_to_edit.item, donation_to_edit.date),
         )
 
     def edit_wish(self):
@@ -373,13 +709,10 @@ class Merrymatch:
             messagebox.showwarning("Select", "Please select a wish to edit.")
             return
 
-        tags = self.wish_tree.item(selected[0])["tags"]
-        if not tags:
+        wish_to_edit = self.wish_view.selected_record()
+        if wish_to_edit is None:
             messagebox.showerror("Error", "Could not identify wish.")
             return
-        
-        wish_idx = int(tags[0].split("_")[1])
-        wish_to_edit = self.wishes[wish_idx]
 
         initial_data = {
             'name': wish_to_edit.recipient,
@@ -392,10 +725,17 @@ class Merrymatch:
             initial_data=initial_data,
             is_donation=False,
             item_to_edit=wish_to_edit,
-            original_keys=(wish_to_edit.recipient, wish_to_edit.item, wish_to_edit.date),
         )
 
 
+    def _delete_done(self, pending_ids, row_id):
+        #Callback for a background DELETE: once it is done the id can be
+        #forgotten; if it failed it stays pending and is retried on close
+        def done(deleted):
+            if deleted:
+                pending_ids.discard(row_id)
+        return done
+
     def delete_donation(self):
         #Handler for DELETE SELECTED button on Donations tab.
         selected = self.donation_tree.selection()
@@ -404,11 +744,15 @@ class Merrymatch:
             return
             
         if messagebox.askyesno("Confirm", "Delete this donation?"):
-            tags = self.donation_tree.item(selected[0])["tags"]
-            if tags:
-                donation_idx = int(tags[0].split("_")[1])
-                removed = self.donations.pop(donation_idx)
-                db_delete_donation(removed.donor, removed.item, removed.date)
+            removed = self.donation_view.selected_record()
+            if removed is not None:
+                del self.donations_by_id[removed.id]
+                self.donation_totals.remove(removed)
+                self.donations.remove(removed)
+                self.donation_view.discard(removed)
+                self.deleted_donation_ids.add(removed.id)
+                self.worker.submit(db_delete_donation, removed.id,
+                                   on_done=self._delete_done(self.deleted_donation_ids, removed.id))
 
             self.refresh_all()
             messagebox.showinfo("Success", "Donation deleted.")
@@ -422,115 +766,259 @@ class Merrymatch:
             return
             
         if messagebox.askyesno("Confirm", "Delete this wish?"):
-            tags = self.wish_tree.item(selected[0])["tags"]
-            if tags:
-                wish_idx = int(tags[0].split("_")[1])
-                removed = self.wishes.pop(wish_idx)
-                db_delete_wish(removed.recipient, removed.item, removed.date)
+            removed = self.wish_view.selected_record()
+            if removed is not None:
+                del self.wishes_by_id[removed.id]
+                self.wish_totals.remove(removed)
+                self.wishes.remove(removed)
+                self.wish_view.discard(removed)
+                self.deleted_wish_ids.add(removed.id)
+                self.worker.submit(db_delete_wish, removed.id,
+                                   on_done=self._delete_done(self.deleted_wish_ids, removed.id))
 
             self.refresh_all()
             messagebox.showinfo("Success", "Wish deleted.")
 
     #Core Logic 
     def auto_match(self):
-        #Logic to match available donations with pending wishes
+        #Logic to match available donations with pending wishes.
+        #The matching pass runs on the background worker; _finish_match
+        #applies the result back on the Tk thread.
+        if self.match_task is not None or self.loads_running > 0:
+            return
 
-        matches = []
-        
-        #Filter for items that can be matched (quantity > 0 and correct status)
-        donations_for_match = [d for d in self.donations if d.status == "Available" and d.quantity > 0]
-        wishes_for_match = [w for w in self.wishes if w.status == "Pending" and w.quantity > 0]
-
-        #Iteration and Matching
-        for wish in wishes_for_match:
-            for donation in donations_for_match:
-                #Match if same Category AND same Item Name (case-insensitive)
-                if (donation.category == wish.category and 
-                    donation.item.lower() == wish.item.lower()):
-                    
-                    old_donation_key = (donation.donor, donation.item, donation.date)
-                    old_wish_key = (wish.recipient, wish.item, wish.date)
-
-                    #Determine the quantity to match (the lesser of available or needed)
-                    qty_matched = min(donation.quantity, wish.quantity)
-                    
-                    if qty_matched > 0:
-                        matches.append(f"✓ Matched: {donation.item} ({qty_matched}) from {donation.donor} → {wish.recipient}")
-                        
-                        #Update Donation object
-                        donation.quantity -= qty_matched
-                        if donation.quantity == 0:
-                            donation.status = "Matched"
-                        
-                        #Update Wish object
-                        wish.quantity -= qty_matched
-                        if wish.quantity == 0:
-                            wish.status = "Fulfilled"
-
-                        #Keep database updated as matches occur
-                        db_update_donation(*old_donation_key, donation)
-                        db_update_wish(*old_wish_key, wish)
-
-                        #Break the inner loop if the wish is now fully fulfilled
-                        if wish.quantity == 0:
-                            break
-
-        #Display results
-        self.match_text.delete(1.0, tk.END)
-        if matches:
-            self.match_text.insert(tk.END, " MATCHING RESULTS \n\n")
-            self.match_text.insert(tk.END, "\n".join(matches))
-            self.match_text.insert(tk.END, f"\n\n Total Matches: {len(matches)}")
+        self.cancel_match_button.config(state="normal")
+        self.match_progress.config(value=0, maximum=1)
+        self.match_results.message("Matching...")
+        self.match_started = time.perf_counter()
+
+        normalizer = self._item_normalizer() if self.fuzzy_var.get() else None
+        strategy = self.strategy_var.get()
+        self.match_task = self.worker.submit(
+            plan_match, normalizer, strategy,
+            with_task=True,
+            on_done=self._finish_match,
+            on_progress=self._show_match_progress,
+            on_cancel=self._match_cancelled,
+            on_error=self._match_failed,
+        )
+        self._update_match_button()
+
+    def _item_normalizer(self):
+        #Default synonyms plus any from SYNONYMS_FILE next to the database
+        synonyms = None
+        if os.path.exists(SYNONYMS_FILE):
+            try:
+                synonyms = load_synonyms(SYNONYMS_FILE)
+            except (OSError, ValueError) as e:
+                messagebox.showwarning("Synonyms", f"Could not read {SYNONYMS_FILE}: {e}")
+        return ItemNormalizer(synonyms)
+
+    def cancel_match(self):
+        #Handler for the Cancel button on the Wishy Matchy tab
+        if self.match_task is not None:
+            self.match_task.cancel()
+
+    def _show_match_progress(self, done, total):
+        self.match_progress.config(value=done, maximum=max(total, 1))
+
+    def _update_match_button(self):
+        #Matching needs every record loaded and only one run at a time
+        busy = self.match_task is not None or self.loads_running > 0
+        self.match_button.config(state="disabled" if busy else "normal")
+
+    def _end_match(self):
+        self.match_task = None
+        self._update_match_button()
+        self.cancel_match_button.config(state="disabled")
+
+    def _match_cancelled(self):
+        self._end_match()
+        self.match_progress.config(value=0)
+        self.match_results.message("Matching cancelled.")
+
+    def _match_failed(self, error):
+        self._end_match()
+        self.match_results.clear()
+        messagebox.showerror("Error", f"Matching failed: {error}")
+
+    def _match_saved(self, donations, wishes, before):
+        #save_match_results leaves the records holding what the database
+        #stores, which differs from the plan where another station matched
+        #or edited the same rows meanwhile. If nothing was saved, the records
+        #go back to how they were before the match (before: id(record) ->
+        #(record, quantity, status, dirty)), so that closing the app does not
+        #write the matched quantities without their ledger rows.
+        def done(left_out):
+            if left_out is None:
+                for record, quantity, status, dirty in before.values():
+                    record.quantity, record.status = quantity, status
+                    record.dirty = dirty
+                for donation in donations:
+                    self.donation_totals.update(donation)
+                for wish in wishes:
+                    self.wish_totals.update(wish)
+                self.refresh_all()
+                self.match_results.note("None of these were saved; the records are unchanged.")
+                messagebox.showwarning("Database", "Match results did not save to the database.")
+                return
+            for donation in donations:
+                self.donation_totals.update(donation)
+            for wish in wishes:
+                self.wish_totals.update(wish)
             self.refresh_all()
-            messagebox.showinfo("Success", f"Matched {len(matches)} items!")
+            if left_out:
+                self.match_results.note(f"{len(left_out)} of these were already taken by "
+                                        "another station and were not saved.")
+                messagebox.showwarning("Changed Elsewhere",
+                                       f"{len(left_out)} matches were already taken by another station.")
+        return done
+
+    def _finish_match(self, result):
+        self._end_match()
+        allocations, claim = result
+
+        ledger = []
+        summary = MatchSummary()
+        changed_donations = {}
+        changed_wishes = {}
+
+        skipped = set()
+        before = {}
+        for row_donation, row_wish, qty_matched in allocations:
+            donation = self._loaded_record(row_donation, self.donations, self.donations_by_id,
+                                           self.donation_totals, self.deleted_donation_ids)
+            wish = self._loaded_record(row_wish, self.wishes, self.wishes_by_id,
+                                       self.wish_totals, self.deleted_wish_ids)
+            #Skip anything deleted or edited while the match was running; its
+            #key stays queued, so the next run looks at it again
+            if (donation is None or wish is None
+                    or donation.quantity < qty_matched or wish.quantity < qty_matched):
+                skipped.add((row_donation.category, row_donation.item))
+                skipped.add((row_wish.category, row_wish.item))
+                continue
+            ledger.append((donation, wish, qty_matched))
+            summary.add(donation, wish, qty_matched)
+
+            #Update Donation and Wish objects (remembering how they were)
+            for record in (donation, wish):
+                if id(record) not in before:
+                    before[id(record)] = (record, record.quantity, record.status, record.dirty)
+            apply_match(donation, wish, qty_matched)
+            changed_donations[id(donation)] = donation
+            changed_wishes[id(wish)] = wish
+            self.donation_totals.update(donation)
+            self.wish_totals.update(wish)
+
+        #Write the whole run and its ledger rows to the database in one
+        #transaction; this also marks the queued changes as matched
+        if ledger or claim is not None or skipped:
+            donations = list(changed_donations.values())
+            wishes = list(changed_wishes.values())
+            self.worker.submit(
+                save_match_results, donations, wishes, ledger, claim, sorted(skipped),
+                on_done=self._match_saved(donations, wishes, before),
+            )
+
+        #Display results (the summary at once, the match lines a chunk at a time)
+        if allocations:
+            self.refresh_all()   #also lists records first loaded above
+        if ledger:
+            self.match_results.show(ledger, summary)
         else:
-            self.match_text.insert(tk.END, "No matches found.\nTry adding more donations or wishes!")
+            self.match_results.message("No matches found.\nTry adding more donations or wishes!")
+
+        #Click to results on screen, not counting the time the message box stays open
+        perf.record("gui.auto_match", time.perf_counter() - self.match_started, rows=len(ledger))
+        if ledger:
+            messagebox.showinfo("Success", f"Matched {len(ledger)} items!")
+
+    def toggle_diagnostics(self, event=None):
+        #Ctrl+Shift+D: opens the diagnostics window, or closes it if open
+        if self.diagnostics is not None:
+            self.diagnostics.close()
+            return
+        from diagnostics import DiagnosticsWindow
+        self.diagnostics = DiagnosticsWindow(self.root, on_close=self._diagnostics_closed)
+
+    def _diagnostics_closed(self):
+        self.diagnostics = None
+
+    def export_data(self):
+        #Handler for EXPORT...: asks where to save, then streams the export
+        #on the worker so a large one doesn't freeze the window
+        if self.export_task is not None:
+            self.export_task.cancel()
+            return
+        from tkinter import filedialog
+        choice = self.export_var.get()
+        kind, extension = EXPORT_CHOICES[choice]
+        path = filedialog.asksaveasfilename(
+            parent=self.root, title=f"Export {choice}", defaultextension=extension,
+            initialfile=f"merrymatch_{kind}{extension}",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Text", "*.txt")])
+        if not path:
+            return
+        if kind != "picklist" and exporter.detect_format(path) == "text":
+            messagebox.showerror("Export", "Only the pick list can be saved as text.")
+            return
+        self.export_button.config(text="Cancel")
+        self.export_label.config(text="Exporting...")
+        self.export_task = self.worker.submit(
+            export_file, kind, path,
+            with_task=True,
+            on_done=self._export_done,
+            on_progress=lambda rows: self.export_label.config(text=f"{rows} rows..."),
+            on_cancel=lambda: self._end_export("Export cancelled."),
+            on_error=self._export_failed,
+        )
+
+    def _end_export(self, text):
+        self.export_task = None
+        self.export_button.config(text="EXPORT...")
+        self.export_label.config(text=text)
+
+    def _export_done(self, result):
+        path, rows = result
+        self._end_export(f"{rows} rows exported.")
+        messagebox.showinfo("Export", f"Exported {rows} rows to {path}")
+
+    def _export_failed(self, error):
+        self._end_export("")
+        messagebox.showerror("Export", f"Export failed: {error}")
 
     def clear_matches(self):
         #Clears the output text area in the Matching tab
-        self.match_text.delete(1.0, tk.END)
+        self.match_results.clear()
 
+    @perf.instrument("gui.refresh_all")
     def refresh_all(self):
         #Updates the Treeviews and stats labels to reflect current in-memory data
         
-        #Refresh Donations Tab 
-        for item in self.donation_tree.get_children():
-            self.donation_tree.delete(item)
-        
-        total_donations = 0
-        available_qty = 0
-        for idx, d in enumerate(self.donations):
-            #Insert object data into the Treeview row with index tag
-            item_id = self.donation_tree.insert("", "end", values=(d.donor, d.item, d.quantity, 
-                                                        d.category, d.status, d.date), tags=(f"donation_{idx}",))
-            total_donations += 1
-            if d.status == "Available" and d.quantity > 0:
-                available_qty += d.quantity 
-
-        #Update stats label
-        self.donation_stats.config(text=f"TOTAL DONATIONS: {total_donations} | AVAILABLE: {available_qty}")
-
-        #Refresh Wishes Tab
-        for item in self.wish_tree.get_children():
-            self.wish_tree.delete(item)
-        
-        total_wishes = 0
-        pending_qty = 0
-        for idx, w in enumerate(self.wishes):
-            #Insert object data into the Treeview row with index tag
-            item_id = self.wish_tree.insert("", "end", values=(w.recipient, w.item, w.quantity, 
-                                                    w.category, w.status, w.date), tags=(f"wish_{idx}",))
-            total_wishes += 1
-            if w.status == "Pending" and w.quantity > 0:
-                pending_qty += w.quantity 
-        
-        #Update stats label
-        self.wish_stats.config(text=f"TOTAL WISH LIST: {total_wishes} | PENDING: {pending_qty}")
+        #Refresh Donations Tab (only rows that changed are touched)
+        self.donation_view.set_records(self.donations)
+
+        #Refresh Wishes Tab (only rows that changed are touched)
+        self.wish_view.set_records(self.wishes)
+
+        self.update_stats()
+
+    def update_stats(self):
+        #Stats labels come straight from the running totals (no list scans)
+        self.donation_stats.config(text=f"TOTAL DONATIONS: {self.donation_totals.total} | "
+                                        f"AVAILABLE: {self.donation_totals.open_quantity}")
+        self.wish_stats.config(text=f"TOTAL WISH LIST: {self.wish_totals.total} | "
+                                    f"PENDING: {self.wish_totals.open_quantity}")
+
+        lines = [f"{category}: {available} AVAILABLE / {pending} PENDING"
+                 for category, available, pending in category_breakdown(self.donation_totals, self.wish_totals)]
+        self.breakdown_label.config(text="\n".join(lines))
 
 
 #RUN BLOCK
 
 if __name__ == "__main__":
+    load_tk()
     root = tk.Tk()
     app = Merrymatch(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,108 @@
+#background.py - runs database work and matching off the Tk main loop
+import queue
+import threading
+
+
+class TaskCancelled(Exception):
+    #Raised inside a job when its Cancel button was pressed
+    pass
+
+
+class Task:
+    #Handle for one submitted job. The job can report progress through it and
+    #the UI can cancel it; cancelling takes effect at the job's next report.
+
+    def __init__(self, worker, fn, args, on_done, on_error, on_progress, on_cancel):
+        self._worker = worker
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancel = on_cancel
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report(self, *payload):
+        #Called from the job (worker thread); hands payload to on_progress on the Tk thread
+        if self.cancelled():
+            raise TaskCancelled()
+        if self.on_progress is not None:
+            self._worker._post(self.on_progress, payload)
+
+
+def report_each(task, items):
+    #Job that hands every item of an iterator (e.g. chunks of rows) to on_progress
+    for item in items:
+        task.report(item)
+
+
+class BackgroundWorker:
+    #One worker thread that runs jobs in the order they were submitted (so
+    #database writes keep their order). Results are handed back to Tk by
+    #polling a queue with root.after, so callbacks always run on the Tk thread.
+
+    def __init__(self, root, poll_ms=50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="merrymatch-worker", daemon=True)
+        self._thread.start()
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None,
+               on_cancel=None, with_task=False):
+        #Queues fn(*args) (or fn(task, *args) when with_task=True) and returns its Task
+        task = Task(self, fn, args, on_done, on_error, on_progress, on_cancel)
+        if with_task:
+            task.args = (task,) + args
+        self._jobs.put(task)
+        return task
+
+    def shutdown(self):
+        #Finishes the queued jobs and stops the thread (callbacks are dropped)
+        self._jobs.put(None)
+        self._thread.join()
+        self.root.after_cancel(self._poll_id)
+
+    def _post(self, callback, payload):
+        self._results.put((callback, payload))
+
+    def _run(self):
+        while True:
+            task = self._jobs.get()
+            if task is None:
+                break
+            if task.cancelled():
+                if task.on_cancel is not None:
+                    self._post(task.on_cancel, ())
+                continue
+            try:
+                result = task.fn(*task.args)
+            except TaskCancelled:
+                if task.on_cancel is not None:
+                    self._post(task.on_cancel, ())
+            except Exception as e:
+                if task.on_error is not None:
+                    self._post(task.on_error, (e,))
+                else:
+                    print(f"Error in background task: {e}")
+            else:
+                if task.on_done is not None:
+                    self._post(task.on_done, (result,))
+
+    def _poll(self):
+        #Runs on the Tk thread: deliver everything the worker has finished
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+        while True:
+            try:
+                callback, payload = self._results.get_nowait()
+            except queue.Empty:
+                break
+            callback(*payload)
@@ -0,0 +1,328 @@
+#benchmark.py - timings for the database layer, matching and the GUI refresh
+#
+#Examples:
+#   python benchmark.py                                  (1k, 10k, 100k and 1M records)
+#   python benchmark.py --sizes 1000,10000 --output before.json
+#   python benchmark.py --sizes 1000,10000 --compare before.json
+#
+#Every size gets a fresh database in a temporary folder; merry_match.db is
+#never touched. Results go to a JSON file so runs from different commits can
+#be compared with --compare.
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+import data_manager
+import exporter
+from donation import Donation
+from matcher import find_matches, find_matches_columnar, apply_match
+from Merrymatch import CATEGORIES, MATCH_WORKERS
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+#Single-row add/update/delete are timed this many times each per size
+SINGLE_ROW_OPS = 200
+
+#Share of the loaded records edited before the "changed" save/refresh timings
+CHANGED_SHARE = 0.01
+
+#(benchmark name, search text, sort column) for one page of search_donations
+SEARCHES = (
+    ("search (sort by donor)", "", "donor"),
+    ("search donor name", "Donor 1234", "created_at"),
+    ("search item by quantity", "kite", "quantity"),
+)
+
+#(export kind, file name) timed after the match, so the ledger has rows
+EXPORTS = (
+    ("donations", "donations.csv"),
+    ("matches", "matches.jsonl"),
+    ("picklist", "picklist.txt"),
+)
+
+ITEMS = {
+    "Toys": ["Teddy Bear", "Doll", "Toy Car", "Puzzle", "Ball", "Kite", "Robot", "Blocks"],
+    "Clothes": ["Sweater", "Jacket", "Scarf", "Gloves", "Socks", "Hat", "T-Shirt", "Boots"],
+    "Food": ["Canned Soup", "Rice", "Pasta", "Cereal", "Cookies", "Tea", "Coffee", "Jam"],
+    "Books": ["Picture Book", "Novel", "Cookbook", "Atlas", "Comic", "Dictionary"],
+    "Electronics": ["Headphones", "Tablet", "Radio", "Charger", "Speaker", "Torch"],
+    "Other": ["Blanket", "Backpack", "Umbrella", "Mug", "Candle", "Board Game"],
+}
+
+
+def synthetic_rows(count, names, open_status, closed_status, seed):
+    #(name, item, quantity, category, status, date) tuples: four in five open
+    #this season, the rest closed in an earlier season
+    rng = random.Random(seed)
+    this_year = date.today().year
+    for i in range(count):
+        category = rng.choice(CATEGORIES)
+        if rng.random() < 0.8:
+            status, year, quantity = open_status, this_year, rng.randint(1, 5)
+        else:
+            status, year, quantity = closed_status, this_year - rng.randint(2, 4), 0
+        yield (f"{names} {i}", rng.choice(ITEMS[category]), quantity, category, status,
+               f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+
+
+def timed(fn, *args):
+    #(seconds, result) of one call
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+class Recorder:
+    #Collects one result per (size, benchmark) and prints it as it comes in
+
+    def __init__(self):
+        self.results = []
+
+    def add(self, size, name, seconds, ops=1, **extra):
+        self.results.append({"size": size, "benchmark": name, "seconds": seconds, "ops": ops, **extra})
+        per_op = f"  ({seconds / ops * 1000:.3f} ms/op)" if ops > 1 else ""
+        notes = "".join(f"  {key}={value}" for key, value in extra.items())
+        print(f"{size:>9}  {name:<32}{seconds:10.3f} s{per_op}{notes}", flush=True)
+
+
+def bench_database(size, recorder, seed):
+    seconds, _ = timed(data_manager.bulk_add_donations,
+                       synthetic_rows(size, "Donor", "Available", "Matched", seed))
+    recorder.add(size, "bulk_add_donations", seconds)
+    seconds, _ = timed(data_manager.bulk_add_wishes,
+                       synthetic_rows(size, "Recipient", "Pending", "Fulfilled", seed + 1))
+    recorder.add(size, "bulk_add_wishes", seconds)
+
+    seconds, donations = timed(data_manager.load_donations)
+    recorder.add(size, "load_donations", seconds)
+    seconds, wishes = timed(data_manager.load_wishes)
+    recorder.add(size, "load_wishes", seconds)
+
+    for name, text, sort in SEARCHES:
+        seconds, page = timed(data_manager.search_donations, text, sort)
+        recorder.add(size, name, seconds, found=len(page))
+    #The same pages again, now from the query cache
+    for name, text, sort in SEARCHES:
+        seconds, page = timed(data_manager.search_donations, text, sort)
+        recorder.add(size, f"{name} (cached)", seconds, found=len(page))
+
+    seconds, _ = timed(data_manager.save_donations, donations)
+    recorder.add(size, "save_donations (unchanged)", seconds)
+    for d in donations[:max(1, int(len(donations) * CHANGED_SHARE))]:
+        d.date = d.date
+    seconds, _ = timed(data_manager.save_donations, donations)
+    recorder.add(size, "save_donations (1% changed)", seconds)
+
+    added = [Donation("Bench Donor", "Kite", 1, "Toys", "Available", "2024-12-01")
+             for _ in range(SINGLE_ROW_OPS)]
+    seconds, _ = timed(lambda: [data_manager.add_donation(d) for d in added])
+    recorder.add(size, "add_donation", seconds, SINGLE_ROW_OPS)
+    for d in added:
+        d.quantity = 2
+    seconds, _ = timed(lambda: [data_manager.update_donation(d) for d in added])
+    recorder.add(size, "update_donation", seconds, SINGLE_ROW_OPS)
+    seconds, _ = timed(lambda: [data_manager.delete_donation(d.id) for d in added])
+    recorder.add(size, "delete_donation", seconds, SINGLE_ROW_OPS)
+
+    #The same with write-behind on, including the write that puts them in the database
+    added = [Donation("Bench Donor", "Kite", 1, "Toys", "Available", "2024-12-01")
+             for _ in range(SINGLE_ROW_OPS)]
+    data_manager.enable_write_behind()
+    for name, op in (("add_donation (buffered)", data_manager.add_donation),
+                     ("update_donation (buffered)", data_manager.update_donation),
+                     ("delete_donation (buffered)", lambda d: data_manager.delete_donation(d.id))):
+        for d in added:
+            d.quantity = 3
+        seconds, _ = timed(lambda: ([op(d) for d in added], data_manager.flush_writes()))
+        recorder.add(size, name, seconds, SINGLE_ROW_OPS)
+    data_manager.disable_write_behind()
+    return donations, wishes
+
+
+def run_match(donations, wishes):
+    #What auto_match does, minus the widgets: plan, apply, save with ledger rows
+    allocations = find_matches(donations, wishes)
+    for donation, wish, qty_matched in allocations:
+        apply_match(donation, wish, qty_matched)
+    data_manager.save_match_results(list({id(d): d for d, _, _ in allocations}.values()),
+                                    list({id(w): w for _, w, _ in allocations}.values()),
+                                    allocations)
+    return allocations
+
+
+class SilentDialogs:
+    #Stands in for tkinter.messagebox so the hidden window never blocks
+    def showinfo(self, *args, **kwargs):
+        pass
+
+    showwarning = showerror = showinfo
+
+    def askyesno(self, *args, **kwargs):
+        return True
+
+
+def pump_until(root, done, timeout=3600):
+    #Runs the Tk event loop of the hidden root until done() is true
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("GUI benchmark timed out")
+        root.update()
+        time.sleep(0.001)
+
+
+def bench_gui(size, recorder):
+    #Starts the real app under a withdrawn root (needs a display)
+    import Merrymatch
+    Merrymatch.load_tk()
+    try:
+        root = Merrymatch.tk.Tk()
+    except Merrymatch.tk.TclError as e:
+        print(f"{size:>9}  GUI benchmarks skipped: {e}")
+        return
+    root.withdraw()
+    Merrymatch.messagebox = SilentDialogs()
+    try:
+        start = time.perf_counter()
+        app = Merrymatch.Merrymatch(root)
+        pump_until(root, lambda: app.loads_running == 0)
+        recorder.add(size, "gui load", time.perf_counter() - start)
+
+        seconds, _ = timed(app.refresh_all)
+        recorder.add(size, "refresh_all (unchanged)", seconds)
+        for d in app.donations[:max(1, int(len(app.donations) * CHANGED_SHARE))]:
+            d.quantity += 1
+            app.donation_totals.update(d)
+        seconds, _ = timed(app.refresh_all)
+        recorder.add(size, "refresh_all (1% changed)", seconds)
+
+        start = time.perf_counter()
+        app.auto_match()
+        pump_until(root, lambda: app.match_task is None)
+        recorder.add(size, "auto_match", time.perf_counter() - start)
+        pump_until(root, lambda: not app.match_results.filling)
+        recorder.add(size, "auto_match (all lines shown)", time.perf_counter() - start)
+        app.worker.shutdown()
+    finally:
+        root.destroy()
+
+
+def bench_size(size, recorder, workdir, seed, gui):
+    data_manager.close_connections()
+    data_manager.DATABASE_FILE = os.path.join(workdir, f"bench_{size}.db")
+    donations, wishes = bench_database(size, recorder, seed)
+
+    if gui:
+        #The GUI gets its own copy so both matching runs start from the same data
+        data_manager.close_connections()
+        gui_file = os.path.join(workdir, f"bench_{size}_gui.db")
+        shutil.copyfile(data_manager.DATABASE_FILE, gui_file)
+        main_file, data_manager.DATABASE_FILE = data_manager.DATABASE_FILE, gui_file
+        bench_gui(size, recorder)
+        data_manager.close_connections()
+        data_manager.DATABASE_FILE = main_file
+
+    #Planning alone, in this process and in a pool (at least two processes, so
+    #the parallel path is timed even on one core, and min_records=0 so it is
+    #timed below PARALLEL_MIN_RECORDS too); both must give the same plan
+    seconds, serial = timed(find_matches, donations, wishes)
+    recorder.add(size, "find_matches", seconds)
+    workers = max(2, MATCH_WORKERS)
+    seconds, parallel = timed(lambda: find_matches(donations, wishes, workers=workers, min_records=0))
+    recorder.add(size, f"find_matches ({workers} processes)", seconds, same=parallel == serial)
+    del serial, parallel
+
+    #A full pass over the open rows as objects and as columns (what
+    #merrymatch_cli.py match --full loads)
+    seconds, _ = timed(lambda: ([d for chunk in data_manager.iter_donations(status="Available") for d in chunk],
+                                [w for chunk in data_manager.iter_wishes(status="Pending") for w in chunk]))
+    recorder.add(size, "load open records", seconds)
+    seconds, columns = timed(lambda: (data_manager.load_open_donation_columns(),
+                                      data_manager.load_open_wish_columns()))
+    recorder.add(size, "load open columns", seconds)
+    seconds, planned = timed(find_matches_columnar, *columns)
+    recorder.add(size, "find_matches_columnar", seconds, allocations=len(planned))
+    del columns, planned
+
+    seconds, allocations = timed(run_match, donations, wishes)
+    recorder.add(size, "match", seconds, allocations=len(allocations))
+
+    for kind, name in EXPORTS:
+        path = os.path.join(workdir, f"export_{size}_{name}")
+        seconds, rows = timed(exporter.export, kind, path)
+        recorder.add(size, f"export {kind}", seconds, rows=rows)
+        os.remove(path)
+    data_manager.close_connections()
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(old_path, results):
+    #Prints new vs old seconds for every benchmark present in both files
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["size"], r["benchmark"]): r["seconds"] for r in json.load(f)["results"]}
+    print(f"\nCompared with {old_path}:")
+    for r in results:
+        before = old.get((r["size"], r["benchmark"]))
+        if before:
+            print(f"{r['size']:>9}  {r['benchmark']:<32}{before:10.3f} s -> {r['seconds']:.3f} s"
+                  f"  ({r['seconds'] / before:.2f}x)")
+
+
+def parse_sizes(text):
+    return [int(size) for size in text.split(",") if size.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MerryMatch benchmarks")
+    parser.add_argument("--sizes", type=parse_sizes, default=list(DEFAULT_SIZES),
+                        help="comma-separated record counts (default: 1000,10000,100000,1000000)")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="JSON file for the results (default: %(default)s)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--no-gui", action="store_true", help="skip the Tk benchmarks")
+    parser.add_argument("--seed", type=int, default=2024, help="random seed for the synthetic data")
+    args = parser.parse_args(argv)
+
+    recorder = Recorder()
+    workdir = tempfile.mkdtemp(prefix="merrymatch_bench_")
+    try:
+        for size in args.sizes:
+            bench_size(size, recorder, workdir, args.seed, not args.no_gui)
+    finally:
+        data_manager.close_connections()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": recorder.results}, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(args.compare, recorder.results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+#columnar.py - column-per-field store of many Donation/Wish rows for bulk work
+import sys
+from array import array
+
+#Stored in the ids column for records that have not been saved yet
+NO_ID = -1
+
+
+class RecordColumns:
+    #Holds the fields of a list of records as parallel columns: ids and
+    #quantities in compact integer arrays, the text fields in lists with
+    #repeated strings (category, status, item, date) interned so they are
+    #shared. Row i is the i-th row that was appended.
+
+    def __init__(self, name_field):
+        self.name_field = name_field  #"donor" or "recipient"
+        self.ids = array("q")
+        self.versions = array("q")
+        self.quantities = array("q")
+        self.names = []
+        self.items = []
+        self.categories = []
+        self.statuses = []
+        self.dates = []
+
+    def append_row(self, id, name, item, quantity, category, status, date, version=0):
+        #The fields of one database row, without making a record object for it
+        self.ids.append(NO_ID if id is None else id)
+        self.versions.append(version)
+        self.quantities.append(quantity)
+        self.names.append(name)
+        self.items.append(sys.intern(item))
+        self.categories.append(sys.intern(category))
+        self.statuses.append(sys.intern(status))
+        self.dates.append(sys.intern(date))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def record(self, i, make):
+        #Row i as a record object; make is Donation or Wish
+        return make(self.names[i], self.items[i], self.quantities[i], self.categories[i],
+                    self.statuses[i], self.dates[i], None if self.ids[i] == NO_ID else self.ids[i],
+                    self.versions[i])
+
+    def rows_with(self, status, min_quantity=1):
+        #Row numbers whose status matches and quantity is at least min_quantity
+        quantities = self.quantities
+        return [i for i, s in enumerate(self.statuses)
+                if s == status and quantities[i] >= min_quantity]
@@ -1,35 +1,207 @@
 # data_manager.py for SQL
 import sqlite3
 import os
+import json
+import re
+import secrets
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import socket
+from datetime import date, datetime, timezone
+from itertools import islice
 from donation import Donation
 from wish import Wish
+from columnar import RecordColumns
+import perf
+from perf import instrument, count_query
 
 DATABASE_FILE = "merry_match.db"
 
-def get_connection():
-    conn = sqlite3.connect(DATABASE_FILE)
+#Connection tuning (applied once per connection when it is opened)
+CACHED_STATEMENTS = 256     #prepared statements kept per connection
+CACHE_SIZE_KIB = 8192       #page cache per connection
+BUSY_TIMEOUT_MS = 5000      #how long to wait for another station's write lock
+PRAGMAS = (
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA journal_mode=WAL",   #needs shared memory: one computer, not a network share
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{CACHE_SIZE_KIB}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+#Rows per chunk handed out by iter_donations/iter_wishes
+LOAD_CHUNK_SIZE = 500
+
+#(month, day) a drive season starts. Matched/fulfilled rows dated before the
+#current season's start belong to past seasons and are not loaded at startup.
+#Keep it well away from the drive itself: the default of July 1 keeps a
+#holiday drive running from November into January in one season.
+SEASON_START = (7, 1)
+
+#Rows per transaction for bulk_add_donations/bulk_add_wishes
+BULK_BATCH_SIZE = 50000
+
+#Query cache (see _cached)
+CACHED_TABLES = ("donations", "wishes", "matches")
+QUERY_CACHE_ENTRIES = 256      #results kept; the least recently used go first
+QUERY_CACHE_MAX_ROWS = 5000    #larger results are not kept
+
+#Write-behind (see enable_write_behind)
+WRITE_BEHIND_MAX_PENDING = 200   #buffered records that force a write
+ID_BLOCK_SIZE = 100              #row ids reserved at a time for buffered adds
+JOURNAL_FSYNC = False            #fsync each journal line (power loss, not just a crash)
+JOURNAL_SLOTS = 8                #programs per computer that can buffer at once
+
+#One long-lived connection per thread, reused by every function below
+_local = threading.local()
+_open_connections = []
+_pool_lock = threading.Lock()
+
+#Database files whose schema was checked by init_database in this process
+_ready_paths = set()
+_init_lock = threading.Lock()
+
+#(DATABASE_FILE, query key) -> (table generations, rows), shared by all threads
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+class _CountingConnection(sqlite3.Connection):
+    #Counts execute/executemany calls for perf.snapshot(). (A trace callback
+    #would see every row of an executemany, but costs several µs per row.)
+    def execute(self, *args):
+        count_query()
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        count_query()
+        return super().executemany(*args)
+
+def _open_connection():
+    conn = sqlite3.connect(DATABASE_FILE, cached_statements=CACHED_STATEMENTS,
+                           check_same_thread=False, factory=_CountingConnection)
     conn.row_factory = sqlite3.Row  #Access columns by name
+    try:
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+    except sqlite3.DatabaseError:
+        conn.close()
+        raise
+    with _pool_lock:
+        _open_connections.append(conn)
+    return conn
+
+def get_connection():
+    #Returns this thread's pooled connection, opening it on first use.
+    #A new one is opened if DATABASE_FILE was pointed somewhere else.
+    #The first use of a database file also runs init_database on it.
+    if DATABASE_FILE not in _ready_paths:
+        init_database()
+    return _thread_connection()
+
+def _thread_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DATABASE_FILE:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.path = DATABASE_FILE
     return conn
 
+def close_connections():
+    #Closes every pooled connection (call on shutdown or before removing the file)
+    with _pool_lock:
+        while _open_connections:
+            _open_connections.pop().close()
+        _ready_paths.clear()
+    _local.__dict__.clear()
+    #A file created again in the same place starts its generations over
+    with _query_cache_lock:
+        _query_cache.clear()
+
+@contextmanager
+def connection():
+    #Borrow the pooled connection for reads (buffered writes go in first)
+    _apply_buffered_writes()
+    yield get_connection()
+
+@contextmanager
+def transaction(*tables):
+    #Borrow the pooled connection for writes; commits on success, rolls back on error.
+    #BEGIN IMMEDIATE takes the write lock up front (waiting up to BUSY_TIMEOUT_MS
+    #while another station or thread writes), so a transaction that has read
+    #something can't fail later because someone else wrote in between.
+    #tables: the CACHED_TABLES it writes to, so cached reads of them are redone.
+    _apply_buffered_writes()
+    with _write_transaction(tables) as conn:
+        yield conn
+
+@contextmanager
+def _write_transaction(tables=()):
+    #transaction() without writing out the write-behind buffer first
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        if tables:
+            conn.execute(f"""
+                UPDATE table_generations SET generation = generation + 1
+                WHERE name IN ({", ".join("?" for _ in tables)})
+            """, tables)
+
+def _apply_buffered_writes():
+    #Every read and write sees what the write-behind buffer acknowledged
+    writes = _writes
+    if writes is not None and writes.pending:
+        writes.flush()
+
+@instrument("db.init_database")
 def init_database():
-    #If database exists but is corrupted, delete it
-    if os.path.exists(DATABASE_FILE):
+    #Creates or upgrades DATABASE_FILE. Runs on its own the first time a
+    #connection is needed, at most once per file per process; when the
+    #schema is already current this is a single PRAGMA read.
+    with _init_lock:
+        if DATABASE_FILE in _ready_paths:
+            return
         try:
-            # Test if database is readable
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            conn.close()
+            conn = _thread_connection()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
         except sqlite3.DatabaseError as e:
+            #If database exists but is corrupted, delete it
+            if not os.path.exists(DATABASE_FILE):
+                raise
             print(f"Database corrupted, recreating: {e}")
-            conn.close()
+            close_connections()
             os.remove(DATABASE_FILE)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+            conn = _thread_connection()
+            version = 0
+
+        if version < len(MIGRATIONS):
+            _migrate(conn)
+        _ready_paths.add(DATABASE_FILE)
+
+def _migrate(conn):
+    #Brings the schema up to date. PRAGMA user_version holds the number of
+    #MIGRATIONS already applied; each one runs in its own transaction, so an
+    #existing database is upgraded in place and never half-way. The version is
+    #read again once the write lock is held: another station opening the same
+    #database may have applied the step while this one waited for the lock.
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _create_tables(conn):
     #Create donations table (only if it doesn't exist)
-    cursor.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS donations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             donor TEXT NOT NULL,
@@ -41,9 +213,9 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    
+
     #Create wishes table (only if it doesn't exist)
-    cursor.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS wishes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             recipient TEXT NOT NULL,
@@ -55,221 +227,1266 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    
+
     #Create indexes
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_donations_status ON donations(status)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_donations_category ON donations(category)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_wishes_status ON wishes(status)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_wishes_category ON wishes(category)")
-    
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully!")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_donations_status ON donations(status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_donations_category ON donations(category)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wishes_status ON wishes(status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wishes_category ON wishes(category)")
+
+def _create_match_ledger(conn):
+    #Ledger of every match: which donation went to which wish, and how many
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            donation_id INTEGER NOT NULL,
+            wish_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_matches_donation ON matches(donation_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_matches_wish ON matches(wish_id)")
+
+    #match_queue holds the (category, item) pairs that may have new matches:
+    #the triggers add a pair whenever an open donation/wish is added, gets
+    #more quantity, reopens or changes item/category. Matching itself only
+    #lowers quantities, so it never queues anything. A matching run clears
+    #the pairs it looked at (see pending_match_keys).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS match_queue (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            item TEXT NOT NULL,
+            UNIQUE (category, item)
+        )
+    """)
+    for table, open_status in (("donations", "Available"), ("wishes", "Pending")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_queue_insert AFTER INSERT ON {table}
+            WHEN NEW.status = '{open_status}' AND NEW.quantity > 0
+            BEGIN
+                INSERT OR REPLACE INTO match_queue (category, item) VALUES (NEW.category, NEW.item);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_queue_update AFTER UPDATE ON {table}
+            WHEN NEW.status = '{open_status}' AND NEW.quantity > 0
+                 AND (NEW.quantity > OLD.quantity OR NEW.status IS NOT OLD.status
+                      OR NEW.item IS NOT OLD.item OR NEW.category IS NOT OLD.category)
+            BEGIN
+                INSERT OR REPLACE INTO match_queue (category, item) VALUES (NEW.category, NEW.item);
+            END
+        """)
+
+    #Everything still open on an existing database has not been matched yet
+    conn.execute("""
+        INSERT OR IGNORE INTO match_queue (category, item)
+        SELECT DISTINCT category, item FROM wishes WHERE status = 'Pending' AND quantity > 0
+    """)
+
+def _add_access_path_indexes(conn):
+    #item_key is lower(item), computed on read (VIRTUAL), so adding it
+    #does not rewrite any rows. Matching looks rows up by it.
+    for table in ("donations", "wishes"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN item_key TEXT GENERATED ALWAYS AS (lower(item)) VIRTUAL")
+        conn.execute(f"DROP INDEX IF EXISTS idx_{table}_match_key")  #lower(item) index from before item_key
+        #Matching: open rows of one (category, item); quantity makes it covering for the > 0 check
+        conn.execute(f"CREATE INDEX idx_{table}_open_key ON {table}(status, category, item_key, quantity)")
+        #Loads: newest first, with or without a status filter
+        conn.execute(f"CREATE INDEX idx_{table}_created ON {table}(created_at, id)")
+        conn.execute(f"CREATE INDEX idx_{table}_status_created ON {table}(status, created_at, id)")
+        #idx_*_status is a prefix of idx_*_status_created
+        conn.execute(f"DROP INDEX IF EXISTS idx_{table}_status")
+
+def _claimable_match_queue(conn):
+    #The queue triggers fired for every imported row, and INSERT OR REPLACE
+    #into an AUTOINCREMENT table (delete, insert, sqlite_sequence update) cost
+    #more than the row itself. Now a queued pair is one WITHOUT ROWID row that
+    #the triggers only INSERT OR IGNORE. A matching run claims the rows it
+    #starts from (claimed = 1) and deletes just those when it is saved; a
+    #change during the run adds a fresh unclaimed row, so it is not lost.
+    for table in ("donations", "wishes"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}_queue_insert")
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}_queue_update")
+    conn.execute("ALTER TABLE match_queue RENAME TO match_queue_old")
+    conn.execute("""
+        CREATE TABLE match_queue (
+            category TEXT NOT NULL,
+            item TEXT NOT NULL,
+            claimed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (category, item, claimed)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("INSERT OR IGNORE INTO match_queue (category, item) SELECT category, item FROM match_queue_old")
+    conn.execute("DROP TABLE match_queue_old")
+
+    for table, open_status in (("donations", "Available"), ("wishes", "Pending")):
+        conn.execute(f"""
+            CREATE TRIGGER {table}_queue_insert AFTER INSERT ON {table}
+            WHEN NEW.status = '{open_status}' AND NEW.quantity > 0
+            BEGIN
+                INSERT OR IGNORE INTO match_queue (category, item) VALUES (NEW.category, NEW.item);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {table}_queue_update AFTER UPDATE ON {table}
+            WHEN NEW.status = '{open_status}' AND NEW.quantity > 0
+                 AND (NEW.quantity > OLD.quantity OR NEW.status IS NOT OLD.status
+                      OR NEW.item IS NOT OLD.item OR NEW.category IS NOT OLD.category)
+            BEGIN
+                INSERT OR IGNORE INTO match_queue (category, item) VALUES (NEW.category, NEW.item);
+            END
+        """)
 
+def _add_search_index(conn):
+    #Sorting a page by a column walks that column's index (the row id is the
+    #implicit last key, which gives the "col, id" order) instead of sorting
+    #the whole table. category and status already have one.
+    for table, name_field in (("donations", "donor"), ("wishes", "recipient")):
+        for column in (name_field, "item_key", "quantity", "date"):
+            conn.execute(f"CREATE INDEX idx_{table}_{column} ON {table}({column})")
+
+    #FTS5 index over the name and item columns for search_donations/search_wishes.
+    #It reads its text from the table itself (external content), and triggers
+    #keep it current. SQLite builds without FTS5 skip this; search then uses LIKE.
+    for table, name_field in (("donations", "donor"), ("wishes", "recipient")):
+        try:
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE {table}_fts
+                USING fts5({name_field}, item, content='{table}', content_rowid='id')
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search not available, using LIKE: {e}")
+            return
+        conn.execute(f"""
+            CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {table}_fts (rowid, {name_field}, item)
+                VALUES (NEW.id, NEW.{name_field}, NEW.item);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {name_field}, item)
+                VALUES ('delete', OLD.id, OLD.{name_field}, OLD.item);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {table}_fts_update AFTER UPDATE OF {name_field}, item ON {table}
+            WHEN OLD.{name_field} IS NOT NEW.{name_field} OR OLD.item IS NOT NEW.item
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {name_field}, item)
+                VALUES ('delete', OLD.id, OLD.{name_field}, OLD.item);
+                INSERT INTO {table}_fts (rowid, {name_field}, item)
+                VALUES (NEW.id, NEW.{name_field}, NEW.item);
+            END
+        """)
+        conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+def _add_row_versions(conn):
+    #version goes up by one on every write to a row. update_donation/update_wish
+    #only write when the row still has the version it was read with, so an
+    #edit made at one station can't silently overwrite a newer one from another.
+    for table in ("donations", "wishes"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+def _add_table_generations(conn):
+    #A counter per table that every write through this module bumps in its
+    #own transaction (see transaction()), so _cached reads notice changes
+    #made by other stations too. Bumped once per transaction rather than by
+    #a trigger, which would cost an extra write for every row matched.
+    conn.execute("""
+        CREATE TABLE table_generations (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.executemany("INSERT INTO table_generations (name) VALUES (?)",
+                     [(table,) for table in CACHED_TABLES])
+
+def _add_journal_flushes(conn):
+    #Last write-behind journal entry written to the database, per journal
+    #file. It is updated in the same transaction as the writes themselves,
+    #so replaying a journal after a crash never applies an entry twice.
+    conn.execute("""
+        CREATE TABLE journal_flushes (
+            journal TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    """)
+
+#Applied in order; never edit or reorder one that has shipped, add a new one
+MIGRATIONS = (
+    _create_tables,
+    _create_match_ledger,
+    _add_access_path_indexes,
+    _claimable_match_queue,
+    _add_search_index,
+    _add_row_versions,
+    _add_journal_flushes,
+    _add_table_generations,
+)
+
+def _donation_from_row(row):
+    return Donation(row['donor'], row['item'], row['quantity'], row['category'],
+                    row['status'], row['date'], row['id'], row['version'])
+
+@instrument("db.load_donations")
 def load_donations():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT donor, item, quantity, category, status, date 
-            FROM donations 
-            ORDER BY created_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [Donation(
-            row['donor'],
-            row['item'],
-            row['quantity'],
-            row['category'],
-            row['status'],
-            row['date']
-        ) for row in rows]
+        with connection() as conn:
+            rows = conn.execute("""
+                SELECT id, donor, item, quantity, category, status, date, version
+                FROM donations
+                ORDER BY created_at DESC, id DESC
+            """).fetchall()
+
+        return [_donation_from_row(row) for row in rows]
     except Exception as e:
         print(f"Error loading donations: {e}")
         return []
 
-def save_donations(donations):
+def current_season_start(today=None):
+    #Matched/fulfilled rows dated before this are "past seasons" (dates are YYYY-MM-DD):
+    #the latest SEASON_START on or before today
+    today = today or date.today()
+    month, day = SEASON_START
+    start = date(today.year, month, day)
+    if start > today:
+        start = date(today.year - 1, month, day)
+    return start.isoformat()
+
+def _iter_chunks(sql, params, make, chunk_size):
+    #Streams query results chunk_size rows at a time instead of fetchall()
+    with connection() as conn:
+        cursor = conn.execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [make(row) for row in rows]
+        finally:
+            cursor.close()
+
+@instrument("db.iter_donations")
+def iter_donations(chunk_size=LOAD_CHUNK_SIZE, history=False, season_start=None, status=None):
+    #Yields lists of Donation objects, newest first. By default Matched
+    #donations from past seasons are left out; history=True yields only those.
+    #status limits the rows to one status (e.g. only the open ones for matching).
+    season_start = season_start or current_season_start()
+    where = ("status = 'Matched' AND date < ?" if history
+             else "NOT (status = 'Matched' AND date < ?)")
+    params = (season_start,)
+    if status is not None:
+        where += " AND status = ?"
+        params += (status,)
+    return _iter_chunks(f"""
+        SELECT id, donor, item, quantity, category, status, date, version
+        FROM donations
+        WHERE {where}
+        ORDER BY created_at DESC, id DESC
+    """, params, _donation_from_row, chunk_size)
+
+@instrument("db.save_donations")
+def save_donations(donations, deleted_ids=()):
+    #Writes only what changed since the last save: new rows (no id yet),
+    #dirty rows and deleted ids, all in one transaction. Rows changed or
+    #deleted at another station since they were read are not overwritten;
+    #they stay dirty and the result is False.
+    new_rows = [d for d in donations if d.id is None]
+    modified = [d for d in donations if d.id is not None and d.dirty]
+    saved = []
+    conflicts = []
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        #Clear existing donations
-        cursor.execute("DELETE FROM donations")
-        
-        #Insert all donations
-        for d in donations:
-            cursor.execute("""
-                INSERT INTO donations (donor, item, quantity, category, status, date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (d.donor, d.item, d.quantity, d.category, d.status, d.date))
-        
-        conn.commit()
-        conn.close()
+        with transaction("donations") as conn:
+            conn.executemany("DELETE FROM donations WHERE id = ?",
+                             [(donation_id,) for donation_id in deleted_ids])
+            #Row by row, to find the rows changed at another station since they were read
+            for d in modified:
+                cursor = conn.execute("""
+                    UPDATE donations
+                    SET donor = ?, item = ?, quantity = ?, category = ?, status = ?, date = ?,
+                        version = version + 1
+                    WHERE id = ? AND version = ?
+                """, (d.donor, d.item, d.quantity, d.category, d.status, d.date,
+                      d.id, d.version))
+                if cursor.rowcount:
+                    saved.append(d)
+                else:
+                    conflicts.append(d)
+            #Inserted one by one so each new object gets its row id back
+            for d in new_rows:
+                cursor = conn.execute("""
+                    INSERT INTO donations (donor, item, quantity, category, status, date)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (d.donor, d.item, d.quantity, d.category, d.status, d.date))
+                d.id = cursor.lastrowid
+        for d in saved:
+            d.version += 1
+        for d in saved + new_rows:
+            d.dirty = False
+        if conflicts:
+            print(f"Not saved, changed at another station: donations {[d.id for d in conflicts]}")
+            return False
+        return True
     except Exception as e:
         print(f"Error saving donations: {e}")
+        return False
 
+@instrument("db.add_donation")
 def add_donation(donation):
+    if _writes is not None:
+        return _writes.add("donations", donation)
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO donations (donor, item, quantity, category, status, date)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (donation.donor, donation.item, donation.quantity, 
-              donation.category, donation.status, donation.date))
-        conn.commit()
-        conn.close()
+        with transaction("donations") as conn:
+            cursor = conn.execute("""
+                INSERT INTO donations (donor, item, quantity, category, status, date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (donation.donor, donation.item, donation.quantity,
+                  donation.category, donation.status, donation.date))
+        donation.id = cursor.lastrowid
+        donation.dirty = False
         return True
     except Exception as e:
         print(f"Error adding donation: {e}")
         return False
 
-def delete_donation(donor, item, date):
+@instrument("db.delete_donation")
+def delete_donation(donation_id):
+    if _writes is not None:
+        return _writes.delete("donations", donation_id)
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM donations 
-            WHERE donor = ? AND item = ? AND date = ?
-        """, (donor, item, date))
-        conn.commit()
-        conn.close()
+        with transaction("donations") as conn:
+            conn.execute("DELETE FROM donations WHERE id = ?", (donation_id,))
         return True
     except Exception as e:
         print(f"Error deleting donation: {e}")
         return False
 
-def update_donation(original_donor, original_item, original_date, donation):
+@instrument("db.update_donation")
+def update_donation(donation):
+    #False if the write failed, or if the row was changed or deleted at
+    #another station since it was read (its version moved on); get_donation
+    #then gives what the database holds now. With write-behind on, the check
+    #happens when the buffer is written, and flush_writes reports a refusal.
+    if _writes is not None:
+        return _writes.update("donations", donation)
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE donations
-            SET donor = ?, item = ?, quantity = ?, category = ?, status = ?, date = ?
-            WHERE donor = ? AND item = ? AND date = ?
-        """, (
-            donation.donor,
-            donation.item,
-            donation.quantity,
-            donation.category,
-            donation.status,
-            donation.date,
-            original_donor,
-            original_item,
-            original_date
-        ))
-        conn.commit()
-        updated = cursor.rowcount
-        conn.close()
-        return updated > 0
+        with transaction("donations") as conn:
+            cursor = conn.execute("""
+                UPDATE donations
+                SET donor = ?, item = ?, quantity = ?, category = ?, status = ?, date = ?,
+                    version = version + 1
+                WHERE id = ? AND version = ?
+            """, (
+                donation.donor,
+                donation.item,
+                donation.quantity,
+                donation.category,
+                donation.status,
+                donation.date,
+                donation.id,
+                donation.version
+            ))
+        if cursor.rowcount > 0:
+            donation.version += 1
+            donation.dirty = False
+            return True
+        return False
     except Exception as e:
         print(f"Error updating donation: {e}")
         return False
 
+@instrument("db.get_donation")
+def get_donation(donation_id):
+    #The stored donation with this id, None if there is no such row (deleted),
+    #or False if it could not be read
+    try:
+        with connection() as conn:
+            row = conn.execute("""
+                SELECT id, donor, item, quantity, category, status, date, version
+                FROM donations
+                WHERE id = ?
+            """, (donation_id,)).fetchone()
+        return _donation_from_row(row) if row is not None else None
+    except Exception as e:
+        print(f"Error reading donation: {e}")
+        return False
+
+def _wish_from_row(row):
+    return Wish(row['recipient'], row['item'], row['quantity'], row['category'],
+                row['status'], row['date'], row['id'], row['version'])
+
+@instrument("db.load_wishes")
 def load_wishes():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT recipient, item, quantity, category, status, date 
-            FROM wishes 
-            ORDER BY created_at DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [Wish(
-            row['recipient'],
-            row['item'],
-            row['quantity'],
-            row['category'],
-            row['status'],
-            row['date']
-        ) for row in rows]
+        with connection() as conn:
+            rows = conn.execute("""
+                SELECT id, recipient, item, quantity, category, status, date, version
+                FROM wishes
+                ORDER BY created_at DESC, id DESC
+            """).fetchall()
+
+        return [_wish_from_row(row) for row in rows]
     except Exception as e:
         print(f"Error loading wishes: {e}")
         return []
 
-def save_wishes(wishes):
+@instrument("db.iter_wishes")
+def iter_wishes(chunk_size=LOAD_CHUNK_SIZE, history=False, season_start=None, status=None):
+    #Yields lists of Wish objects, newest first. By default Fulfilled
+    #wishes from past seasons are left out; history=True yields only those.
+    #status limits the rows to one status (e.g. only the open ones for matching).
+    season_start = season_start or current_season_start()
+    where = ("status = 'Fulfilled' AND date < ?" if history
+             else "NOT (status = 'Fulfilled' AND date < ?)")
+    params = (season_start,)
+    if status is not None:
+        where += " AND status = ?"
+        params += (status,)
+    return _iter_chunks(f"""
+        SELECT id, recipient, item, quantity, category, status, date, version
+        FROM wishes
+        WHERE {where}
+        ORDER BY created_at DESC, id DESC
+    """, params, _wish_from_row, chunk_size)
+
+@instrument("db.save_wishes")
+def save_wishes(wishes, deleted_ids=()):
+    #Writes only what changed since the last save: new rows (no id yet),
+    #dirty rows and deleted ids, all in one transaction. Rows changed or
+    #deleted at another station since they were read are not overwritten;
+    #they stay dirty and the result is False.
+    new_rows = [w for w in wishes if w.id is None]
+    modified = [w for w in wishes if w.id is not None and w.dirty]
+    saved = []
+    conflicts = []
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Clear existing wishes
-        cursor.execute("DELETE FROM wishes")
-        
-        # Insert all wishes
-        for w in wishes:
-            cursor.execute("""
-                INSERT INTO wishes (recipient, item, quantity, category, status, date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (w.recipient, w.item, w.quantity, w.category, w.status, w.date))
-        
-        conn.commit()
-        conn.close()
+        with transaction("wishes") as conn:
+            conn.executemany("DELETE FROM wishes WHERE id = ?",
+                             [(wish_id,) for wish_id in deleted_ids])
+            #Row by row, to find the rows changed at another station since they were read
+            for w in modified:
+                cursor = conn.execute("""
+                    UPDATE wishes
+                    SET recipient = ?, item = ?, quantity = ?, category = ?, status = ?, date = ?,
+                        version = version + 1
+                    WHERE id = ? AND version = ?
+                """, (w.recipient, w.item, w.quantity, w.category, w.status, w.date,
+                      w.id, w.version))
+                if cursor.rowcount:
+                    saved.append(w)
+                else:
+                    conflicts.append(w)
+            #Inserted one by one so each new object gets its row id back
+            for w in new_rows:
+                cursor = conn.execute("""
+                    INSERT INTO wishes (recipient, item, quantity, category, status, date)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (w.recipient, w.item, w.quantity, w.category, w.status, w.date))
+                w.id = cursor.lastrowid
+        for w in saved:
+            w.version += 1
+        for w in saved + new_rows:
+            w.dirty = False
+        if conflicts:
+            print(f"Not saved, changed at another station: wishes {[w.id for w in conflicts]}")
+            return False
+        return True
     except Exception as e:
         print(f"Error saving wishes: {e}")
+        return False
 
+@instrument("db.add_wish")
 def add_wish(wish):
+    if _writes is not None:
+        return _writes.add("wishes", wish)
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO wishes (recipient, item, quantity, category, status, date)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (wish.recipient, wish.item, wish.quantity, 
-              wish.category, wish.status, wish.date))
-        conn.commit()
-        conn.close()
+        with transaction("wishes") as conn:
+            cursor = conn.execute("""
+                INSERT INTO wishes (recipient, item, quantity, category, status, date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (wish.recipient, wish.item, wish.quantity,
+                  wish.category, wish.status, wish.date))
+        wish.id = cursor.lastrowid
+        wish.dirty = False
         return True
     except Exception as e:
         print(f"Error adding wish: {e}")
         return False
 
-def delete_wish(recipient, item, date):
+@instrument("db.delete_wish")
+def delete_wish(wish_id):
+    if _writes is not None:
+        return _writes.delete("wishes", wish_id)
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM wishes 
-            WHERE recipient = ? AND item = ? AND date = ?
-        """, (recipient, item, date))
-        conn.commit()
-        conn.close()
+        with transaction("wishes") as conn:
+            conn.execute("DELETE FROM wishes WHERE id = ?", (wish_id,))
         return True
     except Exception as e:
         print(f"Error deleting wish: {e}")
         return False
 
-def update_wish(original_recipient, original_item, original_date, wish):
+@instrument("db.update_wish")
+def update_wish(wish):
+    #False if the write failed, or if the row was changed or deleted at
+    #another station since it was read (its version moved on); get_wish
+    #then gives what the database holds now. With write-behind on, the check
+    #happens when the buffer is written, and flush_writes reports a refusal.
+    if _writes is not None:
+        return _writes.update("wishes", wish)
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE wishes
-            SET recipient = ?, item = ?, quantity = ?, category = ?, status = ?, date = ?
-            WHERE recipient = ? AND item = ? AND date = ?
-        """, (
-            wish.recipient,
-            wish.item,
-            wish.quantity,
-            wish.category,
-            wish.status,
-            wish.date,
-            original_recipient,
-            original_item,
-            original_date
-        ))
-        conn.commit()
-        updated = cursor.rowcount
-        conn.close()
-        return updated > 0
+        with transaction("wishes") as conn:
+            cursor = conn.execute("""
+                UPDATE wishes
+                SET recipient = ?, item = ?, quantity = ?, category = ?, status = ?, date = ?,
+                    version = version + 1
+                WHERE id = ? AND version = ?
+            """, (
+                wish.recipient,
+                wish.item,
+                wish.quantity,
+                wish.category,
+                wish.status,
+                wish.date,
+                wish.id,
+                wish.version
+            ))
+        if cursor.rowcount > 0:
+            wish.version += 1
+            wish.dirty = False
+            return True
+        return False
     except Exception as e:
         print(f"Error updating wish: {e}")
         return False
 
-#Initialize database on module import
+@instrument("db.get_wish")
+def get_wish(wish_id):
+    #The stored wish with this id, None if there is no such row (deleted),
+    #or False if it could not be read
+    try:
+        with connection() as conn:
+            row = conn.execute("""
+                SELECT id, recipient, item, quantity, category, status, date, version
+                FROM wishes
+                WHERE id = ?
+            """, (wish_id,)).fetchone()
+        return _wish_from_row(row) if row is not None else None
+    except Exception as e:
+        print(f"Error reading wish: {e}")
+        return False
+
+#Sort keys for search_donations/search_wishes -> ORDER BY columns (the row id
+#always comes last). Each matches an index; item sorts case-insensitively.
+SEARCH_SORT_COLUMNS = {
+    "donor": ("donor",),
+    "recipient": ("recipient",),
+    "item": ("item_key",),
+    "quantity": ("quantity",),
+    "category": ("category",),
+    "status": ("status", "created_at"),
+    "date": ("date",),
+    "created_at": ("created_at",),
+}
+
+def _search_filter(conn, table, name_field, text):
+    #WHERE clause and parameters for rows whose name or item contains every
+    #word of text (as a word prefix with FTS5, as a substring with LIKE)
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return "", ()
+    has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                           (f"{table}_fts",)).fetchone()
+    if has_fts:
+        return (f"WHERE id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)",
+                (" ".join(f'"{word}"*' for word in words),))
+    patterns = ["%" + re.sub(r"([\\%_])", r"\\\1", word) + "%" for word in words]
+    where = " AND ".join(f"({name_field} LIKE ? ESCAPE '\\' OR item LIKE ? ESCAPE '\\')"
+                         for _ in words)
+    return "WHERE " + where, tuple(p for pattern in patterns for p in (pattern, pattern))
+
+def _search(table, columns, name_field, make, text, sort, descending, limit, offset):
+    if sort not in SEARCH_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {sort}")
+    direction = "DESC" if descending else "ASC"
+    order = ", ".join(f"{column} {direction}" for column in SEARCH_SORT_COLUMNS[sort] + ("id",))
+    with connection() as conn:
+        def query():
+            where, params = _search_filter(conn, table, name_field, text)
+            return conn.execute(f"""
+                SELECT {columns}
+                FROM {table}
+                {where}
+                ORDER BY {order}
+                LIMIT ? OFFSET ?
+            """, params + (limit, offset)).fetchall()
+        rows = _cached(conn, (table,), ("search", table, text, sort, descending, limit, offset), query)
+    return [make(row) for row in rows]
+
+def _count(table, name_field, text):
+    with connection() as conn:
+        def query():
+            where, params = _search_filter(conn, table, name_field, text)
+            return conn.execute(f"SELECT COUNT(*) FROM {table} {where}", params).fetchone()[0]
+        return _cached(conn, (table,), ("count", table, text), query)
+
+def _cached(conn, tables, key, query):
+    #query()'s result, reused until a write to one of tables (CACHED_TABLES)
+    #from any station bumps its generation; reading the generations is one
+    #small query. Results are rows (or counts), so every caller still gets
+    #its own record objects.
+    generations = tuple(conn.execute(f"""
+        SELECT generation FROM table_generations
+        WHERE name IN ({", ".join("?" for _ in tables)})
+        ORDER BY name
+    """, tables))
+    key = (DATABASE_FILE,) + key
+    with _query_cache_lock:
+        hit = _query_cache.get(key)
+        if hit is not None and hit[0] == generations:
+            _query_cache.move_to_end(key)
+            perf.record("db.query_cache_hit", 0.0)
+            return hit[1]
+    result = query()
+    if not isinstance(result, list) or len(result) <= QUERY_CACHE_MAX_ROWS:
+        with _query_cache_lock:
+            _query_cache[key] = (generations, result)
+            _query_cache.move_to_end(key)
+            while len(_query_cache) > QUERY_CACHE_ENTRIES:
+                _query_cache.popitem(last=False)
+    return result
+
+@instrument("db.search_donations")
+def search_donations(text="", sort="created_at", descending=True, limit=LOAD_CHUNK_SIZE, offset=0):
+    #One page of donations (every season) whose donor or item matches text,
+    #sorted in SQL by one of SEARCH_SORT_COLUMNS
+    try:
+        return _search("donations", "id, donor, item, quantity, category, status, date, version", "donor",
+                       _donation_from_row, text, sort, descending, limit, offset)
+    except Exception as e:
+        print(f"Error searching donations: {e}")
+        return []
+
+@instrument("db.count_donations")
+def count_donations(text=""):
+    #How many donations search_donations(text) can page through
+    try:
+        return _count("donations", "donor", text)
+    except Exception as e:
+        print(f"Error counting donations: {e}")
+        return 0
+
+@instrument("db.search_wishes")
+def search_wishes(text="", sort="created_at", descending=True, limit=LOAD_CHUNK_SIZE, offset=0):
+    #One page of wishes (every season) whose recipient or item matches text,
+    #sorted in SQL by one of SEARCH_SORT_COLUMNS
+    try:
+        return _search("wishes", "id, recipient, item, quantity, category, status, date, version", "recipient",
+                       _wish_from_row, text, sort, descending, limit, offset)
+    except Exception as e:
+        print(f"Error searching wishes: {e}")
+        return []
+
+@instrument("db.count_wishes")
+def count_wishes(text=""):
+    #How many wishes search_wishes(text) can page through
+    try:
+        return _count("wishes", "recipient", text)
+    except Exception as e:
+        print(f"Error counting wishes: {e}")
+        return 0
+
+@instrument("db.pending_match_keys")
+def pending_match_keys():
+    #Claims the (category, item) pairs changed since the last matching run
+    #for a new run and returns (claim, pairs); save_match_results(claim=claim)
+    #removes that run's pairs. Pairs another run claimed are taken over too,
+    #whether that run was never saved or is still going at another station,
+    #so a pair stays queued until a run that matched it is saved.
+    #Match the rows load_open_donations/load_open_wishes return for them, not
+    #a station's loaded records: the queue also holds other stations' changes.
+    #Returns (None, None) if the queue can't be read; match everything then.
+    claim = secrets.randbits(62) + 1   #claimed = 0 is an unclaimed row
+    try:
+        with transaction() as conn:
+            #Where a pair is queued more than once, one of its rows is taken
+            conn.execute("UPDATE OR IGNORE match_queue SET claimed = ?", (claim,))
+            rows = conn.execute("SELECT category, item FROM match_queue WHERE claimed = ?",
+                                (claim,)).fetchall()
+        return claim, [(row['category'], row['item']) for row in rows]
+    except Exception as e:
+        print(f"Error reading match queue: {e}")
+        return None, None
+
+def _open_for_keys(table, columns, open_status, keys, make):
+    #Open rows whose (category, item_key) is one of keys, newest first,
+    #looked up through the idx_*_open_key index
+    with connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {columns}
+            FROM (SELECT DISTINCT json_extract(value, '$[0]') AS category,
+                                  lower(json_extract(value, '$[1]')) AS item_key
+                  FROM json_each(?)) AS k
+            JOIN {table} AS t ON t.category = k.category AND t.item_key = k.item_key
+            WHERE t.status = ? AND t.quantity > 0
+            ORDER BY t.created_at DESC, t.id DESC
+        """, (json.dumps(list(keys)), open_status)).fetchall()
+    return [make(row) for row in rows]
+
+@instrument("db.load_open_donations")
+def load_open_donations(keys):
+    #Available donations for the given (category, item) pairs, e.g. from pending_match_keys()
+    try:
+        return _open_for_keys("donations", "t.id, t.donor, t.item, t.quantity, t.category, t.status, "
+                              "t.date, t.version",
+                              "Available", keys, _donation_from_row)
+    except Exception as e:
+        print(f"Error loading donations: {e}")
+        return []
+
+@instrument("db.load_open_wishes")
+def load_open_wishes(keys):
+    #Pending wishes for the given (category, item) pairs, e.g. from pending_match_keys()
+    try:
+        return _open_for_keys("wishes", "t.id, t.recipient, t.item, t.quantity, t.category, t.status, "
+                              "t.date, t.version",
+                              "Pending", keys, _wish_from_row)
+    except Exception as e:
+        print(f"Error loading wishes: {e}")
+        return []
+
+def _open_columns(table, name_field, open_status):
+    #Every open row of table as columnar.RecordColumns, in iter_donations/
+    #iter_wishes order, without making an object per row
+    columns = RecordColumns(name_field)
+    append_row = columns.append_row
+    for chunk in _iter_chunks(f"""
+        SELECT id, {name_field}, item, quantity, category, status, date, version
+        FROM {table}
+        WHERE status = ? AND quantity > 0
+        ORDER BY created_at DESC, id DESC
+    """, (open_status,), tuple, LOAD_CHUNK_SIZE):
+        for row in chunk:
+            append_row(*row)
+    return columns
+
+@instrument("db.load_open_donation_columns")
+def load_open_donation_columns():
+    #Available donations as columns, for a full matching pass over many rows
+    try:
+        return _open_columns("donations", "donor", "Available")
+    except Exception as e:
+        print(f"Error loading donations: {e}")
+        return RecordColumns("donor")
+
+@instrument("db.load_open_wish_columns")
+def load_open_wish_columns():
+    #Pending wishes as columns, for a full matching pass over many rows
+    try:
+        return _open_columns("wishes", "recipient", "Pending")
+    except Exception as e:
+        print(f"Error loading wishes: {e}")
+        return RecordColumns("recipient")
+
+@instrument("db.iter_matches")
+def iter_matches(chunk_size=LOAD_CHUNK_SIZE):
+    #Yields lists of (donation_id, wish_id, quantity, matched_at) from the ledger, oldest first
+    return _iter_chunks("""
+        SELECT donation_id, wish_id, quantity, matched_at
+        FROM matches
+        ORDER BY id
+    """, (), tuple, chunk_size)
+
+#What exporter.py can write: kind -> ((column, expression), ...), rest of the
+#query. Each order comes straight off an index (INDEXED BY keeps the planner
+#from picking the status index and sorting), so even a million rows are never
+#sorted or held in memory. A ledger row whose donation or wish was deleted
+#since is still exported, with those fields empty.
+_EXPORTS = {
+    "donations": ((("id", "id"), ("donor", "donor"), ("item", "item"),
+                   ("quantity", "quantity"), ("category", "category"), ("status", "status"),
+                   ("date", "date"), ("created_at", "created_at")),
+                  "FROM donations ORDER BY id"),
+    "wishes": ((("id", "id"), ("recipient", "recipient"), ("item", "item"),
+                ("quantity", "quantity"), ("category", "category"), ("status", "status"),
+                ("date", "date"), ("created_at", "created_at")),
+               "FROM wishes ORDER BY id"),
+    "outstanding": ((("id", "id"), ("recipient", "recipient"), ("item", "item"),
+                     ("quantity", "quantity"), ("category", "category"), ("date", "date")),
+                    """FROM wishes INDEXED BY idx_wishes_recipient
+                     WHERE status = 'Pending' ORDER BY recipient, id"""),
+    "matches": ((("match_id", "m.id"), ("matched_at", "m.matched_at"),
+                 ("donation_id", "m.donation_id"), ("wish_id", "m.wish_id"),
+                 ("donor", "d.donor"), ("recipient", "w.recipient"), ("item", "w.item"),
+                 ("category", "w.category"), ("quantity", "m.quantity")),
+                """FROM matches m
+                   LEFT JOIN donations d ON d.id = m.donation_id
+                   LEFT JOIN wishes w ON w.id = m.wish_id
+                   ORDER BY m.id"""),
+    "picklist": ((("recipient", "w.recipient"), ("wish_id", "w.id"), ("item", "w.item"),
+                  ("category", "w.category"), ("quantity", "m.quantity"),
+                  ("donor", "d.donor"), ("donation_id", "m.donation_id"),
+                  ("matched_at", "m.matched_at")),
+                 """FROM wishes w INDEXED BY idx_wishes_recipient
+                    JOIN matches m ON m.wish_id = w.id
+                    LEFT JOIN donations d ON d.id = m.donation_id
+                    ORDER BY w.recipient, w.id, m.id"""),
+}
+EXPORT_KINDS = tuple(_EXPORTS)
+
+#Rows per chunk handed out by iter_export
+EXPORT_CHUNK_SIZE = 5000
+
+def export_columns(kind):
+    #Column names of the rows iter_export(kind) yields
+    return [name for name, _ in _EXPORTS[kind][0]]
+
+@instrument("db.iter_export")
+def iter_export(kind, chunk_size=EXPORT_CHUNK_SIZE):
+    #Yields lists of row tuples (see export_columns) for one of EXPORT_KINDS
+    columns, rest = _EXPORTS[kind]
+    select = ", ".join(f"{expression} AS {name}" for name, expression in columns)
+    return _iter_chunks(f"SELECT {select} {rest}", (), tuple, chunk_size)
+
+#Claim used by save_match_results: takes n units from a row only while it is
+#still open and has at least n left, closing it when they were the last ones.
+#Two stations matching at once can't both take the same units. With a
+#version it also requires the row to be unchanged since it was read.
+_CLAIM_SQL = {
+    table: f"""
+        UPDATE {table}
+        SET quantity = quantity - ?1,
+            status = CASE WHEN quantity = ?1 THEN '{closed_status}' ELSE status END,
+            version = version + 1
+        WHERE id = ?2 AND status = '{open_status}' AND quantity >= ?1
+              AND (?3 IS NULL OR version = ?3)
+    """
+    for table, open_status, closed_status in (("donations", "Available", "Matched"),
+                                              ("wishes", "Pending", "Fulfilled"))
+}
+
+def _claim_all(conn, matches, as_read):
+    #One claim per row for the matches' total quantities; as_read adds the
+    #version check. True if every claim went in; if not, the caller must
+    #roll back the ones that did.
+    per_row = {"donations": {}, "wishes": {}}
+    for donation, wish, qty_matched in matches:
+        for table, record in (("donations", donation), ("wishes", wish)):
+            qty, version = per_row[table].get(record.id, (0, None))
+            per_row[table][record.id] = (qty + qty_matched, record.version if as_read else None)
+    claimed = 0
+    for table, rows in per_row.items():
+        claimed += conn.executemany(_CLAIM_SQL[table], [(qty, row_id, version)
+                                                        for row_id, (qty, version) in rows.items()]).rowcount
+    return claimed == len(per_row["donations"]) + len(per_row["wishes"])
+
+def _open_quantities(conn, table, open_status, ids):
+    #id -> quantity still open, for the rows in ids that are open
+    rows = conn.execute(f"""
+        SELECT id, quantity
+        FROM {table}
+        WHERE status = ? AND id IN (SELECT value FROM json_each(?))
+    """, (open_status, json.dumps(list(ids)))).fetchall()
+    return {row['id']: row['quantity'] for row in rows}
+
+def _claim_matches(conn, matches):
+    #Claims every match's quantity from its donation and its wish; must be
+    #the first write of the transaction. Returns (matches left out, whether
+    #every row was still as the records had it).
+    if _claim_all(conn, matches, as_read=True):
+        return [], True
+    #Some rows changed since they were read (another station matched or
+    #edited them). Start over, go through the matches in order against what
+    #is left and claim only those that still fit. The write lock is held
+    #from the read on, so those claims can't fail.
+    conn.rollback()
+    conn.execute("BEGIN IMMEDIATE")
+    donations_left = _open_quantities(conn, "donations", "Available", {d.id for d, _, _ in matches})
+    wishes_left = _open_quantities(conn, "wishes", "Pending", {w.id for _, w, _ in matches})
+    taken = []
+    left_out = []
+    for match in matches:
+        donation, wish, qty_matched = match
+        if donations_left.get(donation.id, 0) >= qty_matched and wishes_left.get(wish.id, 0) >= qty_matched:
+            donations_left[donation.id] -= qty_matched
+            wishes_left[wish.id] -= qty_matched
+            taken.append(match)
+        else:
+            left_out.append(match)
+    _claim_all(conn, taken, as_read=False)
+    return left_out, False
+
+def _stored_state(conn, table, records):
+    #id -> (quantity, status, version) as the database holds them now
+    rows = conn.execute(f"""
+        SELECT id, quantity, status, version
+        FROM {table}
+        WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps([r.id for r in records]),)).fetchall()
+    return {row['id']: (row['quantity'], row['status'], row['version']) for row in rows}
+
+@instrument("db.save_match_results")
+def save_match_results(donations, wishes, matches=(), claim=None, requeue=()):
+    #Writes one matching run in a single transaction. Each match (donation,
+    #wish, qty_matched) claims its quantity from both rows (see _CLAIM_SQL)
+    #and gets a ledger row; a match whose units another station took first
+    #is left out. claim (from pending_match_keys()) marks the pairs this run
+    #claimed as done; pairs claimed by other runs stay. The (category, item)
+    #pairs of left-out matches, and those in requeue (e.g. matches the caller
+    #skipped), stay queued for the next run, since their records may still
+    #match. Afterwards donations and wishes (the objects in matches, with the
+    #run already applied to them) hold the stored quantity, status and
+    #version again.
+    #Returns the matches left out ([] when all of them went in), or None if
+    #nothing from the run was written.
+    matches = [m for m in matches if m[0].id is not None and m[1].id is not None]
+    try:
+        with transaction("donations", "wishes", "matches") as conn:
+            left_out, as_read = _claim_matches(conn, matches)
+            skipped = set(map(id, left_out))
+            conn.executemany("""
+                INSERT INTO matches (donation_id, wish_id, quantity)
+                VALUES (?, ?, ?)
+            """, [(m[0].id, m[1].id, m[2]) for m in matches if id(m) not in skipped])
+            if claim is not None:
+                conn.execute("DELETE FROM match_queue WHERE claimed = ?", (claim,))
+            unsettled = set(requeue)
+            unsettled.update((record.category, record.item) for match in left_out for record in match[:2])
+            conn.executemany("INSERT OR IGNORE INTO match_queue (category, item) VALUES (?, ?)",
+                             sorted(unsettled))
+            if not as_read:
+                stored = [(records, _stored_state(conn, table, records))
+                          for table, records in (("donations", donations), ("wishes", wishes))]
+        if as_read:
+            #Each claimed row was what the record had, minus what the run applied
+            claimed = {id(record) for match in matches for record in match[:2]}
+            for record in list(donations) + list(wishes):
+                if id(record) in claimed:
+                    record.version += 1
+                record.dirty = False
+        else:
+            for records, state in stored:
+                for record in records:
+                    if record.id in state:
+                        record.quantity, record.status, record.version = state[record.id]
+                    record.dirty = False
+        return left_out
+    except Exception as e:
+        print(f"Error saving match results: {e}")
+        return None
+
+def _bulk_insert(table, columns, rows, batch_size):
+    #Inserts rows from any iterable, committing once per batch_size rows.
+    #Returns how many rows were committed; if a batch fails, the batches
+    #before it stay and the count stops there.
+    #Each batch goes through a temp table and into table with one INSERT, so
+    #the table's triggers run inside a single statement (FTS5 writes out its
+    #index at the end of every statement, which row by row is several times slower).
+    rows = iter(rows)
+    inserted = 0
+    staging = f"temp.bulk_{table}"
+    placeholders = ", ".join("?" for _ in columns.split(","))
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with transaction(table) as conn:
+                conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS bulk_{table} ({columns})")
+                conn.executemany(f"INSERT INTO {staging} VALUES ({placeholders})", batch)
+                conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} ORDER BY rowid")
+                conn.execute(f"DELETE FROM {staging}")
+            inserted += len(batch)
+    except Exception as e:
+        print(f"Error importing {table}: {e}")
+    return inserted
+
+@instrument("db.bulk_add_donations")
+def bulk_add_donations(rows, batch_size=BULK_BATCH_SIZE):
+    #rows: iterable of (donor, item, quantity, category, status, date) tuples
+    return _bulk_insert("donations", "donor, item, quantity, category, status, date",
+                        rows, batch_size)
+
+@instrument("db.bulk_add_wishes")
+def bulk_add_wishes(rows, batch_size=BULK_BATCH_SIZE):
+    #rows: iterable of (recipient, item, quantity, category, status, date) tuples
+    return _bulk_insert("wishes", "recipient, item, quantity, category, status, date",
+                        rows, batch_size)
+
+#Write-behind: while on, add/update/delete of single donations and wishes
+#are appended to a journal file and acknowledged right away, then written to
+#the database together, in one transaction, when WRITE_BEHIND_MAX_PENDING
+#records are waiting, when flush_writes is called (the app does so on a
+#timer), before any other read or write, and by disable_write_behind.
+#Repeated edits of a record become one UPDATE, and a record added and deleted
+#before the write never reaches the database.
+_writes = None
+
+#table -> field holding the person's name
+_RECORD_NAME_FIELDS = {"donations": "donor", "wishes": "recipient"}
+
+def _record_fields(table, record):
+    return (getattr(record, _RECORD_NAME_FIELDS[table]), record.item, record.quantity,
+            record.category, record.status, record.date)
+
+def _reserve_ids(conn, table, count):
+    #Moves the table's AUTOINCREMENT counter count ids on and returns the ids
+    #skipped. Rows inserted anywhere else (another station, a bulk import) get
+    #ids after them, so a buffered add knows its id before it is written.
+    last = conn.execute(f"""
+        SELECT max(coalesce((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                   coalesce((SELECT max(id) FROM {table}), 0))
+    """, (table,)).fetchone()[0]
+    if not conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?",
+                        (last + count, table)).rowcount:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, last + count))
+    return range(last + 1, last + count + 1)
+
+class _WriteBuffer:
+    #pending maps (table, id) -> [op, record, fields, version, created_at] with
+    #op "add", "update" or "delete"; version is the one the UPDATE expects.
+    #record is None for entries replayed from the journal. Journal lines are
+    #numbered; journal_flushes holds the last one written to the database.
+
+    def __init__(self, journal_path, max_pending):
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.refused = []          #records whose buffered edit was refused
+        self.max_pending = max_pending
+        self._free_ids = {table: iter(()) for table in _RECORD_NAME_FIELDS}
+        self.journal = _open_journal(journal_path)
+        self.name = os.path.basename(self.journal.name)
+        try:
+            self.seq = self._replay()
+        except Exception:
+            self.journal.close()
+            raise
+
+    def _replay(self):
+        #Loads the journal entries a crash kept from being written
+        with _write_transaction() as conn:
+            row = conn.execute("SELECT seq FROM journal_flushes WHERE journal = ?",
+                               (self.name,)).fetchone()
+        seq = row[0] if row else 0
+        self.journal.seek(0)
+        for line in self.journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break   #torn last line: it was never acknowledged
+            if entry["seq"] > seq:
+                self._merge(entry["op"], entry["table"], entry["id"], None,
+                            entry.get("fields"), entry.get("version"), entry.get("created_at"))
+            seq = max(seq, entry["seq"])
+        return seq
+
+    def add(self, table, record):
+        try:
+            with self.lock:
+                record_id = next(self._free_ids[table], None)
+                if record_id is None:
+                    with _write_transaction() as conn:
+                        self._free_ids[table] = iter(_reserve_ids(conn, table, ID_BLOCK_SIZE))
+                    record_id = next(self._free_ids[table])
+                created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                self._write("add", table, record_id, record, _record_fields(table, record),
+                            0, created_at)
+                record.id = record_id
+                record.version = 0
+                record.dirty = False
+            return True
+        except Exception as e:
+            print(f"Error buffering new {table} row: {e}")
+            return False
+
+    def update(self, table, record):
+        try:
+            with self.lock:
+                self._write("update", table, record.id, record, _record_fields(table, record),
+                            record.version, None)
+            return True
+        except Exception as e:
+            print(f"Error buffering {table} update: {e}")
+            return False
+
+    def delete(self, table, record_id):
+        try:
+            with self.lock:
+                self._write("delete", table, record_id, None, None, None, None)
+            return True
+        except Exception as e:
+            print(f"Error buffering {table} delete: {e}")
+            return False
+
+    def _write(self, op, table, record_id, record, fields, version, created_at):
+        #Journals the change (acknowledged once this returns), then buffers it
+        self.seq += 1
+        self.journal.write(json.dumps({"seq": self.seq, "op": op, "table": table, "id": record_id,
+                                       "fields": fields, "version": version,
+                                       "created_at": created_at}) + "\n")
+        self.journal.flush()
+        if JOURNAL_FSYNC:
+            os.fsync(self.journal.fileno())
+        self._merge(op, table, record_id, record, fields, version, created_at)
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def _merge(self, op, table, record_id, record, fields, version, created_at):
+        key = (table, record_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            self.pending[key] = [op, record, fields, version, created_at]
+        elif op == "update" and entry[0] != "delete":
+            #Stays an add, or an update expecting the version first read
+            entry[1], entry[2] = record, fields
+        elif op == "delete":
+            if entry[0] == "add":
+                del self.pending[key]
+            else:
+                self.pending[key] = ["delete", None, None, None, None]
+
+    @instrument("db.flush_writes")
+    def flush(self):
+        #Writes everything pending in one transaction. False if it failed;
+        #the changes then stay pending (and journaled) for the next try.
+        with self.lock:
+            if not self.pending:
+                return True
+            entries = list(self.pending.items())
+            written = []
+            refused = []
+            try:
+                with _write_transaction(sorted({table for (table, _), _ in entries})) as conn:
+                    for (table, record_id), (op, record, fields, version, created_at) in entries:
+                        name_field = _RECORD_NAME_FIELDS[table]
+                        if op == "delete":
+                            conn.execute(f"DELETE FROM {table} WHERE id = ?", (record_id,))
+                        elif op == "add":
+                            #The id was reserved for this add, so a row that
+                            #has it already is this add, written before
+                            if conn.execute(f"""
+                                    INSERT OR IGNORE INTO {table} (id, {name_field}, item, quantity,
+                                                                   category, status, date, created_at)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                                """, (record_id, *fields, created_at)).rowcount:
+                                written.append((table, record, fields, None))
+                            else:
+                                print(f"Skipped buffered add of {table} {record_id}: already written")
+                        elif conn.execute(f"""
+                                UPDATE {table}
+                                SET {name_field} = ?, item = ?, quantity = ?, category = ?,
+                                    status = ?, date = ?, version = version + 1
+                                WHERE id = ? AND version = ?
+                            """, (*fields, record_id, version)).rowcount:
+                            written.append((table, record, fields, version))
+                        else:
+                            refused.append((table, record_id, record))
+                    conn.execute("INSERT OR REPLACE INTO journal_flushes (journal, seq) VALUES (?, ?)",
+                                 (self.name, self.seq))
+            except Exception as e:
+                print(f"Error writing buffered changes: {e}")
+                return False
+            self.pending.clear()
+            self.journal.seek(0)
+            self.journal.truncate()
+
+            for table, record, fields, version in written:
+                if record is None:
+                    continue
+                if version is not None and record.version == version:
+                    record.version = version + 1
+                #Unless it was edited again meanwhile
+                if _record_fields(table, record) == fields:
+                    record.dirty = False
+            if refused:
+                print(f"Not saved, changed at another station: "
+                      f"{[f'{table} {record_id}' for table, record_id, _ in refused]}")
+                self.refused.extend(record for _, _, record in refused if record is not None)
+            return True
+
+    def close(self):
+        self.journal.close()
+
+def _lock_journal(journal):
+    #Takes an exclusive lock on the open journal, held until it is closed
+    #(also when the program dies). False if another program holds it.
+    try:
+        if os.name == "nt":
+            import msvcrt
+            journal.seek(0)
+            msvcrt.locking(journal.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+def _open_journal(journal_path):
+    #Opens and locks the first of journal_path, <name>-2.journal, ... that no
+    #other program is using, so each program appends to and replays only its
+    #own journal. A slot left by a crash is replayed by the next program to take it.
+    base, ext = os.path.splitext(journal_path)
+    for slot in range(1, JOURNAL_SLOTS + 1):
+        path = journal_path if slot == 1 else f"{base}-{slot}{ext}"
+        journal = open(path, "a+", encoding="utf-8")
+        if _lock_journal(journal):
+            return journal
+        journal.close()
+    raise RuntimeError(f"all {JOURNAL_SLOTS} journals next to {journal_path} are in use")
+
+@instrument("db.enable_write_behind")
+def enable_write_behind(journal_path=None, max_pending=WRITE_BEHIND_MAX_PENDING):
+    #Turns write-behind on for DATABASE_FILE, after writing out whatever a
+    #crash left in the journal. The journal defaults to a file next to the
+    #database named after this computer; a second program on the same
+    #computer gets the next free one (see _open_journal). Returns False if it
+    #could not be turned on.
+    global _writes
+    if _writes is not None:
+        return True
+    journal_path = journal_path or f"{DATABASE_FILE}-{socket.gethostname()}.journal"
+    try:
+        writes = _WriteBuffer(journal_path, max_pending)
+    except Exception as e:
+        print(f"Error starting write-behind: {e}")
+        return False
+    if not writes.flush():
+        writes.close()
+        return False
+    _writes = writes
+    return True
+
+def disable_write_behind():
+    #Writes what is buffered and turns write-behind off (call on shutdown).
+    #False if something could not be written; it stays in the journal and
+    #goes in the next time write-behind is turned on.
+    global _writes
+    writes = _writes
+    if writes is None:
+        return True
+    flushed = writes.flush()
+    _writes = None
+    writes.close()
+    return flushed
+
+def flush_writes():
+    #Writes what is buffered now. Returns the records whose buffered edit was
+    #refused since the last call (changed or deleted at another station; see
+    #update_donation), or None if the write failed.
+    writes = _writes
+    if writes is None:
+        return []
+    if not writes.flush():
+        return None
+    with writes.lock:
+        refused, writes.refused = writes.refused, []
+    return refused
 
-init_database()
\ No newline at end of file
+def pending_writes():
+    #Number of buffered records not yet written to the database
+    return len(_writes.pending) if _writes is not None else 0
@@ -0,0 +1,94 @@
+#diagnostics.py - hidden window with the perf instrumentation figures (Ctrl+Shift+D)
+import tkinter as tk
+from tkinter import ttk
+
+import perf
+
+#How often the open window re-reads perf.snapshot()
+REFRESH_MS = 1000
+
+#Operation that "Profile next match" runs under cProfile
+MATCH_OPERATION = "match.find_matches"
+
+#(snapshot key, heading, width)
+COLUMNS = (
+    ("operation", "Operation", 230),
+    ("calls", "Calls", 60),
+    ("avg_ms", "Avg ms", 70),
+    ("last_p50_ms", "p50 ms", 70),
+    ("last_p95_ms", "p95 ms", 70),
+    ("max_ms", "Max ms", 70),
+    ("queries", "Queries", 70),
+    ("rows", "Rows", 80),
+)
+
+
+class DiagnosticsWindow:
+    #Toplevel listing, per instrumented operation, its call count, latencies
+    #(p50/p95 over the last perf.RECENT_CALLS calls), SQL statements run and
+    #rows returned. Refreshes itself while open.
+
+    def __init__(self, root, on_close=None):
+        self.on_close = on_close
+        self.window = tk.Toplevel(root)
+        self.window.title("Diagnostics")
+        self.window.geometry("760x420")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.tree = ttk.Treeview(self.window, columns=[key for key, _, _ in COLUMNS], show="headings")
+        for key, heading, width in COLUMNS:
+            self.tree.heading(key, text=heading)
+            self.tree.column(key, width=width, anchor="w" if key == "operation" else "e")
+        self.tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+        buttons = tk.Frame(self.window)
+        buttons.pack(fill="x", padx=5, pady=5)
+        tk.Button(buttons, text="Reset", command=self.reset,
+                  font=("fixedsys", 10)).pack(side="left", padx=5)
+        tk.Button(buttons, text="Profile next match", command=self.profile_next_match,
+                  font=("fixedsys", 10)).pack(side="left", padx=5)
+        tk.Button(buttons, text="Show profile", command=self.show_profile,
+                  font=("fixedsys", 10)).pack(side="left", padx=5)
+        self.status = tk.Label(buttons, text="", font=("fixedsys", 10))
+        self.status.pack(side="left", padx=5)
+
+        self._after_id = None
+        self.refresh()
+
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        for row in perf.snapshot():
+            self.tree.insert("", "end", values=(
+                row["operation"], row["calls"],
+                f"{row['avg_ms']:.2f}", f"{row['last_p50_ms']:.2f}",
+                f"{row['last_p95_ms']:.2f}", f"{row['max_ms']:.2f}",
+                row["queries"], row["rows"],
+            ))
+        self._after_id = self.window.after(REFRESH_MS, self.refresh)
+
+    def reset(self):
+        perf.reset()
+        self.window.after_cancel(self._after_id)
+        self.refresh()
+
+    def profile_next_match(self):
+        perf.profile_next(MATCH_OPERATION)
+        self.status.config(text=f"Next match is profiled (saved to {perf.PROFILE_DIR}/)")
+
+    def show_profile(self):
+        summary = perf.profile_summary(MATCH_OPERATION)
+        if summary is None:
+            self.status.config(text="No profile yet: click Profile next match, then match")
+            return
+        viewer = tk.Toplevel(self.window)
+        viewer.title(f"Profile: {MATCH_OPERATION}")
+        text = tk.Text(viewer, width=110, height=35, font=("Courier", 9))
+        text.pack(fill="both", expand=True)
+        text.insert(tk.END, summary)
+        text.config(state="disabled")
+
+    def close(self):
+        self.window.after_cancel(self._after_id)
+        self.window.destroy()
+        if self.on_close is not None:
+            self.on_close()
@@ -0,0 +1,110 @@
+#exporter.py - streams donations, wishes and match results to files (no Tk)
+#
+#Rows go from the SQLite cursor to the file one chunk at a time, so an export
+#of a million rows uses as little memory as one of ten. The file is written
+#next to the target and renamed into place at the end, so a failed or
+#cancelled export never leaves half a file behind.
+import csv
+import json
+import os
+from datetime import datetime
+from itertools import chain, groupby
+
+import data_manager
+from perf import instrument
+
+#Every kind can be written as CSV or JSON Lines; the pick list also as text
+FORMATS = ("csv", "jsonl", "text")
+
+#Width of the printed pick list
+PICK_LIST_WIDTH = 72
+
+
+def detect_format(path, fmt=None):
+    #From the format given, else the file extension ("csv" if it says nothing)
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".json", ".ndjson"):
+        return "jsonl"
+    if ext == ".txt":
+        return "text"
+    return "csv"
+
+
+@instrument("export.write")
+def export(kind, path, fmt=None, progress=None):
+    #Writes one of data_manager.EXPORT_KINDS to path and returns the number of
+    #rows written. progress(rows) is called after every chunk and may raise to
+    #stop the export (e.g. BackgroundWorker's task.report when cancelled).
+    fmt = detect_format(path, fmt)
+    if fmt == "text" and kind != "picklist":
+        raise ValueError("only the pick list can be written as text")
+    chunks = data_manager.iter_export(kind)
+    partial = path + ".part"
+    try:
+        with open(partial, "w", newline="", encoding="utf-8") as f:
+            if fmt == "text":
+                rows = _write_pick_list(f, chunks, progress)
+            else:
+                rows = _write_rows(f, fmt, data_manager.export_columns(kind), chunks, progress)
+        os.replace(partial, path)
+    except BaseException:
+        chunks.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return rows
+
+
+def _write_rows(f, fmt, columns, chunks, progress):
+    rows = 0
+    if fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        write_chunk = writer.writerows
+    else:
+        def write_chunk(chunk):
+            f.writelines(json.dumps(dict(zip(columns, row))) + "\n" for row in chunk)
+    for chunk in chunks:
+        write_chunk(chunk)
+        rows += len(chunk)
+        if progress:
+            progress(rows)
+    return rows
+
+
+def _write_pick_list(f, chunks, progress):
+    #One block per recipient with a tick box per gift and who it came from.
+    #Rows arrive sorted by recipient, so each block is written as it streams by.
+    f.write("MERRYMATCH PICK LIST\n")
+    f.write(f"Printed {datetime.now():%Y-%m-%d %H:%M}\n")
+    rows = 0
+    recipients = 0
+    for recipient, gifts in groupby(_counted(chain.from_iterable(chunks), progress),
+                                    key=lambda row: row[0]):
+        recipients += 1
+        f.write("\n" + "=" * PICK_LIST_WIDTH + "\n")
+        f.write(f"{recipient}\n")
+        f.write("-" * PICK_LIST_WIDTH + "\n")
+        items = 0
+        for _, wish_id, item, category, quantity, donor, donation_id, _ in gifts:
+            rows += 1
+            items += quantity
+            f.write(f"[ ] {quantity:>4} x {item} ({category})\n")
+            f.write(f"        from {donor or '(deleted donation)'}"
+                    f"  - wish #{wish_id}, donation #{donation_id}\n")
+        f.write(f"{'Total:':>10} {items} items\n")
+    f.write("\n" + "=" * PICK_LIST_WIDTH + "\n")
+    f.write(f"{recipients} recipients, {rows} gifts\n")
+    return rows
+
+
+def _counted(rows, progress, every=data_manager.EXPORT_CHUNK_SIZE):
+    #Passes rows through, calling progress(count) every so often
+    count = 0
+    for row in rows:
+        yield row
+        count += 1
+        if progress and count % every == 0:
+            progress(count)
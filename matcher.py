@@ -0,0 +1,372 @@
+#matcher.py - matching engine used by Merrymatch.auto_match (no Tk dependency)
+import os
+from array import array
+
+from normalize import CandidateIndex
+from perf import instrument
+
+
+def match_key(category, item):
+    #Donations and wishes match on same category AND same item name (case-insensitive)
+    return (category, item.lower())
+
+
+def eligible_donations(donations):
+    #Donations that can still be given away
+    return [d for d in donations if d.status == "Available" and d.quantity > 0]
+
+
+def eligible_wishes(wishes):
+    #Wishes that are still waiting for gifts
+    return [w for w in wishes if w.status == "Pending" and w.quantity > 0]
+
+
+#How many wishes are processed between two progress reports
+PROGRESS_EVERY = 1000
+
+
+def match_keys(categories, items, normalizer=None):
+    #Match keys for parallel category/item sequences. With a normalize.ItemNormalizer
+    #"Teddy Bears" and "teddy bear" get the same key.
+    if normalizer is None:
+        return [match_key(c, i) for c, i in zip(categories, items)]
+    return [(c, normalizer.key(i)) for c, i in zip(categories, items)]
+
+
+def resolve_fuzzy_keys(donation_keys, wish_keys):
+    #Points every wish key that has no donation with exactly that key at the
+    #most similar donation key in the same category (see normalize.CandidateIndex).
+    #Wishes with nothing similar enough keep their own key and stay unmatched.
+    index = CandidateIndex()
+    for category, item_key in dict.fromkeys(donation_keys):
+        index.add(category, item_key)
+    exact = set(donation_keys)
+    return [key if key in exact else (index.best_match(*key) or key) for key in wish_keys]
+
+
+@instrument("match.find_matches")
+def find_matches(donations, wishes, progress=None, normalizer=None, strategy="greedy",
+                 workers=1, min_records=None):
+    #Plans which donation goes to which wish without changing the objects.
+    #Returns a list of (donation, wish, qty_matched) in the same order the old
+    #nested loop produced them: wish by wish, then donation by donation.
+    #progress(done, total) is called every PROGRESS_EVERY wishes; it may raise
+    #to stop the run early. Passing a normalizer turns on fuzzy item names;
+    #strategy picks one of STRATEGIES (oldest wish date has priority).
+    #workers > 1 matches runs of at least min_records (PARALLEL_MIN_RECORDS
+    #by default) in that many processes, with the same result.
+    donations = eligible_donations(donations)
+    wishes = eligible_wishes(wishes)
+    planned = _plan([d.category for d in donations], [d.item for d in donations],
+                    [d.quantity for d in donations],
+                    [w.category for w in wishes], [w.item for w in wishes],
+                    [w.quantity for w in wishes], [w.date for w in wishes],
+                    progress, normalizer, strategy, workers, min_records)
+    return [(donations[d], wishes[w], qty) for d, w, qty in planned]
+
+
+@instrument("match.find_matches_columnar")
+def find_matches_columnar(donation_cols, wish_cols, progress=None, normalizer=None,
+                          strategy="greedy", workers=1, min_records=None):
+    #Same plan as find_matches, but for columnar.RecordColumns. Returns
+    #(donation_row, wish_row, qty_matched) using the columns' row numbers.
+    #Columns holding only open rows (data_manager.load_open_*_columns) are
+    #matched as they are, without copying them per record.
+    donation_rows = donation_cols.rows_with("Available")
+    wish_rows = wish_cols.rows_with("Pending")
+    donation_categories, donation_items, donation_qty, _ = _selected(donation_cols, donation_rows)
+    wish_categories, wish_items, wish_qty, wish_dates = _selected(wish_cols, wish_rows)
+    planned = _plan(donation_categories, donation_items, donation_qty,
+                    wish_categories, wish_items, wish_qty, wish_dates,
+                    progress, normalizer, strategy, workers, min_records)
+    return [(donation_rows[d], wish_rows[w], qty) for d, w, qty in planned]
+
+
+def _selected(columns, rows):
+    #Category, item, quantity and date columns for the given row numbers
+    if len(rows) == len(columns):
+        return columns.categories, columns.items, columns.quantities, columns.dates
+    return ([columns.categories[i] for i in rows], [columns.items[i] for i in rows],
+            [columns.quantities[i] for i in rows], [columns.dates[i] for i in rows])
+
+
+def _plan(donation_categories, donation_items, donation_qty, wish_categories, wish_items,
+          wish_qty, wish_dates, progress, normalizer, strategy, workers, min_records=None):
+    #(donation_pos, wish_pos, qty_matched) triples for parallel record columns
+    if min_records is None:
+        min_records = PARALLEL_MIN_RECORDS
+    if workers > 1 and len(donation_qty) + len(wish_qty) >= min_records:
+        return allocate_partitioned(donation_categories, donation_items, donation_qty,
+                                    wish_categories, wish_items, wish_qty, progress,
+                                    strategy, wish_dates, normalizer, workers)
+    donation_keys = match_keys(donation_categories, donation_items, normalizer)
+    wish_keys = match_keys(wish_categories, wish_items, normalizer)
+    if normalizer is not None:
+        wish_keys = resolve_fuzzy_keys(donation_keys, wish_keys)
+    return allocate(donation_keys, donation_qty, wish_keys, wish_qty, progress,
+                    strategy, wish_dates)
+
+
+#Allocation strategies for allocate():
+#  greedy       - wishes in list order each take what they can (the original behaviour)
+#  oldest_first - same, but the oldest wishes (by priority/date) go first
+#  fair         - within each item bucket, supply is split max-min fairly, so
+#                 small requests are met before big ones take the rest; spare
+#                 units go to the oldest wishes
+STRATEGIES = ("greedy", "oldest_first", "fair")
+
+
+def allocate(donation_keys, donation_qty, wish_keys, wish_qty, progress=None,
+             strategy="greedy", wish_priority=None):
+    #Matching core on plain sequences (one entry per eligible donation/wish).
+    #wish_priority (e.g. wish dates) orders the wishes for oldest_first/fair;
+    #lower values go first. Returns (donation_pos, wish_pos, qty_matched) triples.
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown matching strategy: {strategy}")
+
+    order = range(len(wish_keys))
+    if strategy != "greedy" and wish_priority is not None:
+        order = sorted(order, key=lambda i: (wish_priority[i], i))
+
+    #Bucket donations by match key, keeping list order inside each bucket
+    buckets = {}
+    for pos, key in enumerate(donation_keys):
+        buckets.setdefault(key, []).append(pos)
+
+    if strategy == "fair":
+        return _allocate_fair(buckets, donation_qty, wish_keys, wish_qty, order, progress)
+    return _allocate_greedy(buckets, donation_qty, wish_keys, wish_qty, order, progress)
+
+
+def _allocate_greedy(buckets, donation_qty, wish_keys, wish_qty, order, progress):
+    remaining = list(donation_qty)
+
+    #Donations in a bucket are used up front to back, so a cursor per bucket
+    #skips the ones that are already empty
+    cursors = dict.fromkeys(buckets, 0)
+
+    allocations = []
+    total = len(order)
+    for done, wish_pos in enumerate(order):
+        if progress is not None and done % PROGRESS_EVERY == 0:
+            progress(done, total)
+        key = wish_keys[wish_pos]
+        bucket = buckets.get(key)
+        if not bucket:
+            continue
+
+        needed = wish_qty[wish_pos]
+        pos = cursors[key]
+        while pos < len(bucket) and needed > 0:
+            donation_pos = bucket[pos]
+            qty_matched = min(remaining[donation_pos], needed)
+            allocations.append((donation_pos, wish_pos, qty_matched))
+            remaining[donation_pos] -= qty_matched
+            needed -= qty_matched
+            if remaining[donation_pos] == 0:
+                pos += 1
+        cursors[key] = pos
+
+    if progress is not None:
+        progress(total, total)
+    return allocations
+
+
+def _allocate_fair(buckets, donation_qty, wish_keys, wish_qty, order, progress):
+    #Buckets are independent: split each bucket's supply with fair_shares,
+    #then hand out its donations front to back in wish priority order
+    wishes_by_key = {}
+    for wish_pos in order:
+        if wish_keys[wish_pos] in buckets:
+            wishes_by_key.setdefault(wish_keys[wish_pos], []).append(wish_pos)
+
+    allocations = []
+    total = len(order)
+    done = 0
+    for key, wish_list in wishes_by_key.items():
+        if progress is not None:
+            progress(done, total)
+        bucket = buckets[key]
+        supply = sum(donation_qty[d] for d in bucket)
+        shares = fair_shares([wish_qty[w] for w in wish_list], supply)
+
+        pos = 0
+        left = donation_qty[bucket[0]]
+        for wish_pos, share in zip(wish_list, shares):
+            while share > 0:
+                if left == 0:
+                    pos += 1
+                    left = donation_qty[bucket[pos]]
+                    continue
+                qty_matched = min(left, share)
+                allocations.append((bucket[pos], wish_pos, qty_matched))
+                left -= qty_matched
+                share -= qty_matched
+        done += len(wish_list)
+
+    #Same output order as the greedy strategies: by wish priority, then donation
+    rank = {wish_pos: r for r, wish_pos in enumerate(order)}
+    allocations.sort(key=lambda a: (rank[a[1]], a[0]))
+    if progress is not None:
+        progress(total, total)
+    return allocations
+
+
+def fair_shares(demands, supply):
+    #Max-min fair split of supply over demands (listed in priority order).
+    #Everyone gets min(demand, level) for the highest level the supply allows;
+    #units left over after that go one each to the earliest demands.
+    if sum(demands) <= supply:
+        return list(demands)
+
+    shares = [0] * len(demands)
+    by_size = sorted(range(len(demands)), key=lambda i: (demands[i], i))
+    left = supply
+    for n, i in enumerate(by_size):
+        level = left // (len(by_size) - n)
+        if demands[i] <= level:
+            shares[i] = demands[i]
+            left -= demands[i]
+            continue
+        #Everyone from here on wants more than the level
+        unmet = sorted(by_size[n:])
+        for j in unmet:
+            shares[j] = level
+        left -= level * len(unmet)
+        for j in unmet[:left]:
+            shares[j] += 1
+        break
+    return shares
+
+
+#Parallel matching. A match key never spans two categories, and an exact key
+#never spans two item names, so records can be split into partitions that are
+#matched independently in worker processes: by category for fuzzy matching
+#(similar names are looked up within a category, so there are at most as many
+#partitions as categories) and by a hash of the key otherwise. Runs smaller
+#than PARALLEL_MIN_RECORDS stay in this process, where starting the pool would
+#cost more than it saves.
+PARALLEL_MIN_RECORDS = 500000
+PARTITIONS_PER_WORKER = 4
+
+
+def _partition_columns(members, codes, items, quantities):
+    #Compact columns for one partition's records (members: their positions in
+    #the whole run): position, category code, item name and quantity. Arrays
+    #and plain strings pickle far smaller and faster than Donation/Wish objects.
+    return (array("q", members), array("i", [codes[i] for i in members]),
+            [items[i] for i in members], array("q", [quantities[i] for i in members]))
+
+
+def allocate_partitioned(donation_categories, donation_items, donation_qty,
+                         wish_categories, wish_items, wish_qty, progress=None,
+                         strategy="greedy", wish_priority=None, normalizer=None,
+                         workers=None):
+    #Same triples, in the same order, as match_keys + resolve_fuzzy_keys +
+    #allocate on the whole run, computed in a pool of worker processes.
+    #progress(done, total) is called as partitions finish; if it raises, the
+    #partitions not started yet are cancelled (the running ones finish in the
+    #background, so a cancel takes effect between partitions).
+    #The pool is slow to import and only big runs use it, so only they pay for it
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from multiprocessing import get_context
+
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown matching strategy: {strategy}")
+    workers = workers or os.cpu_count() or 1
+
+    #Wishes are ranked here, once, so every partition serves them in the order
+    #a single run would
+    order = range(len(wish_qty))
+    if strategy != "greedy" and wish_priority is not None:
+        order = sorted(order, key=lambda i: (wish_priority[i], i))
+
+    #Category codes stand in for the names in the partitions (and in the keys
+    #the workers build, which are only compared with each other)
+    codes = {}
+    donation_codes = [codes.setdefault(c, len(codes)) for c in donation_categories]
+    wish_codes = [codes.setdefault(wish_categories[i], len(codes)) for i in order]   #by rank
+    ranked_items = [wish_items[i] for i in order]
+    if normalizer is not None:
+        count = len(codes)
+        donation_parts = donation_codes
+        wish_parts = wish_codes
+    else:
+        count = workers * PARTITIONS_PER_WORKER
+        donation_parts = [hash((c, i.lower())) % count for c, i in zip(donation_codes, donation_items)]
+        wish_parts = [hash((c, i.lower())) % count
+                      for c, i in zip(wish_codes, ranked_items)]
+
+    donation_members = [[] for _ in range(count)]
+    for pos, part in enumerate(donation_parts):
+        donation_members[part].append(pos)
+    wish_members = [[] for _ in range(count)]
+    for rank, part in enumerate(wish_parts):
+        wish_members[part].append(rank)
+
+    #A partition without donations or without wishes has nothing to match
+    ranked_qty = [wish_qty[i] for i in order]
+    partitions = [(_partition_columns(d, donation_codes, donation_items, donation_qty)
+                   + _partition_columns(w, wish_codes, ranked_items, ranked_qty), len(w))
+                  for d, w in zip(donation_members, wish_members) if d and w]
+    total = len(order)
+    done = total - sum(size for _, size in partitions)
+    if progress is not None:
+        progress(done, total)
+
+    triples = []
+    if partitions:
+        #spawn, not fork: the GUI matches from a worker thread, and forking a
+        #process with threads running is unsafe
+        pool = ProcessPoolExecutor(min(workers, len(partitions)), mp_context=get_context("spawn"))
+        try:
+            futures = {pool.submit(_match_partition, strategy, normalizer, *columns): size
+                       for columns, size in partitions}
+            for future in as_completed(futures):
+                flat = iter(future.result())
+                triples.extend(zip(flat, flat, flat))
+                done += futures[future]
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    #Each partition's triples are already in (wish rank, donation) order, so
+    #this sort only merges them into the order one run would produce
+    triples.sort()
+    if progress is not None:
+        progress(total, total)
+    return [(donation_pos, order[rank], qty) for rank, donation_pos, qty in triples]
+
+
+def _match_partition(strategy, normalizer, donation_pos, donation_categories, donation_items,
+                     donation_qty, wish_rank, wish_categories, wish_items, wish_qty):
+    #Runs in a worker process. Wishes arrive in rank order, so oldest_first is
+    #plain greedy here. Returns (wish_rank, donation_pos, qty_matched) triples
+    #flattened into one array.
+    donation_keys = match_keys(donation_categories, donation_items, normalizer)
+    wish_keys = match_keys(wish_categories, wish_items, normalizer)
+    if normalizer is not None:
+        wish_keys = resolve_fuzzy_keys(donation_keys, wish_keys)
+    planned = allocate(donation_keys, donation_qty, wish_keys, wish_qty,
+                       strategy="fair" if strategy == "fair" else "greedy")
+    flat = array("q")
+    for d, w, qty in planned:
+        flat.extend((wish_rank[w], donation_pos[d], qty))
+    return flat
+
+
+def apply_match(donation, wish, qty_matched):
+    #Moves qty_matched from the donation to the wish and updates both statuses
+    donation.quantity -= qty_matched
+    if donation.quantity == 0:
+        donation.status = "Matched"
+
+    wish.quantity -= qty_matched
+    if wish.quantity == 0:
+        wish.status = "Fulfilled"
+
+
+def match_text(donation, wish, qty_matched):
+    #Human-readable line for the Wishy Matchy results area
+    return f"✓ Matched: {donation.item} ({qty_matched}) from {donation.donor} → {wish.recipient}"
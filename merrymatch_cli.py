@@ -0,0 +1,245 @@
+#merrymatch_cli.py - headless entry point for bulk import and matching (no Tk)
+#
+#Examples:
+#   python merrymatch_cli.py import donations donations.csv
+#   python merrymatch_cli.py import wishes wishes.jsonl
+#   python merrymatch_cli.py match --output matches.csv
+#   python merrymatch_cli.py match --workers 0
+#   python merrymatch_cli.py export picklist picklist.txt
+import perf
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+
+import data_manager
+import exporter
+from donation import Donation
+from matcher import find_matches, find_matches_columnar, apply_match, STRATEGIES
+from wish import Wish
+from normalize import ItemNormalizer, load_synonyms
+
+perf.mark("imports")
+
+#Field holding the person's name, and the status for open/closed records
+RECORD_TYPES = {
+    "donations": ("donor", "Available", "Matched"),
+    "wishes": ("recipient", "Pending", "Fulfilled"),
+}
+
+
+def detect_format(path, fmt=None):
+    #"csv" or "jsonl", from --format or the file extension
+    if fmt:
+        return fmt
+    return "jsonl" if path.lower().endswith((".jsonl", ".json", ".ndjson")) else "csv"
+
+
+def read_records(path, fmt):
+    #Yields (line_number, dict) one record at a time, never the whole file
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.reader(f)
+            header = [name.strip() for name in next(reader, [])]
+            for line_number, row in enumerate(reader, start=2):
+                yield line_number, dict(zip(header, row))
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+
+
+def is_iso_date(text):
+    #True for a real date written YYYY-MM-DD (what the app stores and compares)
+    if not isinstance(text, str) or len(text) != 10:
+        return False
+    try:
+        datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def record_rows(records, record_type, counts):
+    #Turns input dicts into insert tuples. Good rows are counted in
+    #counts["rows"]; bad rows are skipped and described in counts["errors"].
+    name_field, open_status, closed_status = RECORD_TYPES[record_type]
+    today = datetime.now().strftime("%Y-%m-%d")
+    for line_number, record in records:
+        try:
+            name = str(record[name_field]).strip()
+            item = str(record["item"]).strip()
+            category = str(record["category"]).strip()
+            quantity = int(record["quantity"])
+            if not name or not item or not category or quantity < 0:
+                raise ValueError("empty field or negative quantity")
+            #Matching and the season filter compare these exactly
+            status = record.get("status") or (open_status if quantity > 0 else closed_status)
+            if status not in (open_status, closed_status):
+                raise ValueError(f"status {status!r} is not {open_status!r} or {closed_status!r}")
+            date = record.get("date") or today
+            if not is_iso_date(date):
+                raise ValueError(f"date {date!r} is not YYYY-MM-DD")
+        except (KeyError, TypeError, ValueError) as e:
+            counts["errors"].append(f"line {line_number}: {e}")
+            continue
+        counts["rows"] += 1
+        yield (name, item, quantity, category, status, date)
+
+
+def import_records(args):
+    counts = {"rows": 0, "errors": []}
+    rows = record_rows(read_records(args.file, detect_format(args.file, args.format)),
+                       args.record_type, counts)
+    bulk_add = (data_manager.bulk_add_donations if args.record_type == "donations"
+                else data_manager.bulk_add_wishes)
+    inserted = bulk_add(rows, batch_size=args.batch_size)
+
+    errors = counts["errors"]
+    for error in errors[:20]:
+        print(f"Skipped {error}", file=sys.stderr)
+    if len(errors) > 20:
+        print(f"... and {len(errors) - 20} more skipped rows", file=sys.stderr)
+    print(f"Imported {inserted} {args.record_type} ({len(errors)} skipped)")
+    return 0 if inserted == counts["rows"] else 1
+
+
+def run_match(args):
+    normalizer = None
+    if args.fuzzy or args.synonyms:
+        normalizer = ItemNormalizer(load_synonyms(args.synonyms) if args.synonyms else None)
+
+    #Only open records can take part in a match. Unless asked for a full pass,
+    #exact matching loads just the (category, item) pairs changed since the
+    #last run; fuzzy matching can pair names across keys, so it loads everything.
+    claim, queued = data_manager.pending_match_keys()
+    workers = args.workers or os.cpu_count() or 1
+    if args.full or normalizer is not None or queued is None:
+        allocations = match_all(normalizer, args.strategy, workers)
+    else:
+        donations = data_manager.load_open_donations(queued)
+        wishes = data_manager.load_open_wishes(queued)
+        allocations = find_matches(donations, wishes, normalizer=normalizer, strategy=args.strategy,
+                                   workers=workers)
+    changed_donations = {}
+    changed_wishes = {}
+    for donation, wish, qty_matched in allocations:
+        apply_match(donation, wish, qty_matched)
+        changed_donations[donation.id] = donation
+        changed_wishes[wish.id] = wish
+
+    if allocations or queued:
+        #Matches another station got to first are left out of the database
+        left_out = data_manager.save_match_results(
+            list(changed_donations.values()), list(changed_wishes.values()), allocations, claim)
+        if left_out is None:
+            return 1
+        if left_out:
+            skipped = set(map(id, left_out))
+            allocations = [a for a in allocations if id(a) not in skipped]
+            print(f"Skipped {len(left_out)} matches already taken by another station", file=sys.stderr)
+
+    if args.output:
+        write_matches(args.output, detect_format(args.output, args.format), allocations)
+    print(f"Matched {len(allocations)} items")
+    return 0
+
+
+def match_all(normalizer, strategy, workers):
+    #A pass over every open record: they are loaded as columns, and Donation/
+    #Wish objects are only made for the rows that were matched
+    donation_cols = data_manager.load_open_donation_columns()
+    wish_cols = data_manager.load_open_wish_columns()
+    planned = find_matches_columnar(donation_cols, wish_cols, normalizer=normalizer,
+                                    strategy=strategy, workers=workers)
+    donations = {}
+    wishes = {}
+    allocations = []
+    for d, w, qty_matched in planned:
+        donation = donations.get(d)
+        if donation is None:
+            donation = donations[d] = donation_cols.record(d, Donation)
+        wish = wishes.get(w)
+        if wish is None:
+            wish = wishes[w] = wish_cols.record(w, Wish)
+        allocations.append((donation, wish, qty_matched))
+    return allocations
+
+
+def write_matches(path, fmt, allocations):
+    fields = ("donation_id", "wish_id", "donor", "recipient", "item", "category", "quantity")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(fields)
+        for donation, wish, qty_matched in allocations:
+            values = (donation.id, wish.id, donation.donor, wish.recipient,
+                      donation.item, donation.category, qty_matched)
+            if writer:
+                writer.writerow(values)
+            else:
+                f.write(json.dumps(dict(zip(fields, values))) + "\n")
+
+
+def export_records(args):
+    try:
+        rows = exporter.export(args.kind, args.file, args.format)
+    except (OSError, ValueError, data_manager.sqlite3.Error) as e:
+        print(f"Error exporting {args.kind}: {e}", file=sys.stderr)
+        return 1
+    print(f"Exported {rows} rows to {args.file}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="MerryMatch headless tools")
+    parser.add_argument("--db", default=data_manager.DATABASE_FILE,
+                        help="SQLite database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_cmd = commands.add_parser("import", help="bulk-import donations or wishes")
+    import_cmd.add_argument("record_type", choices=sorted(RECORD_TYPES))
+    import_cmd.add_argument("file", help="CSV or JSON Lines file")
+    import_cmd.add_argument("--format", choices=("csv", "jsonl"))
+    import_cmd.add_argument("--batch-size", type=int, default=data_manager.BULK_BATCH_SIZE,
+                            help="rows per transaction (default: %(default)s)")
+    import_cmd.set_defaults(func=import_records)
+
+    match_cmd = commands.add_parser("match", help="run a matching pass")
+    match_cmd.add_argument("--output", help="write the matches to this CSV/JSON Lines file")
+    match_cmd.add_argument("--format", choices=("csv", "jsonl"))
+    match_cmd.add_argument("--fuzzy", action="store_true",
+                           help="also match similar item names (plurals, punctuation, synonyms)")
+    match_cmd.add_argument("--synonyms", help="JSON file of extra synonyms (implies --fuzzy)")
+    match_cmd.add_argument("--full", action="store_true",
+                           help="look at every open record, not only those changed since the last run")
+    match_cmd.add_argument("--strategy", choices=STRATEGIES, default=STRATEGIES[0],
+                           help="greedy: list order; oldest_first: oldest wishes first; "
+                                "fair: share short supply evenly (default: %(default)s)")
+    match_cmd.add_argument("--workers", type=int, default=1,
+                           help="processes for large runs, 0 for one per CPU (default: %(default)s)")
+    match_cmd.set_defaults(func=run_match)
+
+    export_cmd = commands.add_parser("export", help="write records or match results to a file")
+    export_cmd.add_argument("kind", choices=data_manager.EXPORT_KINDS,
+                            help="outstanding: pending wishes by recipient; "
+                                 "picklist: matched gifts per recipient")
+    export_cmd.add_argument("file", help="CSV, JSON Lines or (pick list only) .txt file")
+    export_cmd.add_argument("--format", choices=exporter.FORMATS)
+    export_cmd.set_defaults(func=export_records)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    data_manager.DATABASE_FILE = args.db   #opened (and created if needed) on first use
+    status = args.func(args)
+    perf.mark(f"{args.command} done")
+    perf.print_startup_report()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
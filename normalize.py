@@ -0,0 +1,121 @@
+#normalize.py - item name normalization and the fuzzy candidate index used by matcher.py
+import json
+import re
+
+#Synonyms, applied after plurals are removed (word or phrase -> canonical form)
+DEFAULT_SYNONYMS = {
+    "t shirt": "tshirt",
+    "tee": "tshirt",
+    "jumper": "sweater",
+    "pullover": "sweater",
+    "sneaker": "shoe",
+    "trainer": "shoe",
+    "nappy": "diaper",
+    "pram": "stroller",
+}
+
+#Two fuzzy item names match when this share of their words is the same (Jaccard)
+DEFAULT_MIN_SIMILARITY = 0.5
+
+_APOSTROPHES = re.compile(r"['’]")
+_NOT_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def load_synonyms(path):
+    #Reads extra synonyms from a JSON object {"word or phrase": "canonical form"}
+    with open(path, encoding="utf-8") as f:
+        synonyms = json.load(f)
+    return {str(k).lower(): str(v).lower() for k, v in synonyms.items()}
+
+
+def singular(word):
+    #Cheap English plural stripping ("bears" -> "bear", "puppies" -> "puppy")
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes", "zes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+class ItemNormalizer:
+    #Turns an item name into a normalized key: lowercase, punctuation and
+    #extra whitespace removed, plurals made singular and synonyms replaced.
+    #"Teddy Bears", "teddy-bear" and "  TEDDY BEAR " all give "teddy bear".
+    #Results are cached because the same item names repeat a lot.
+
+    def __init__(self, synonyms=None):
+        self.synonyms = dict(DEFAULT_SYNONYMS)
+        if synonyms:
+            self.synonyms.update(synonyms)
+        self._phrases = [(f" {k} ", f" {v} ") for k, v in self.synonyms.items() if " " in k]
+        self._cache = {}
+
+    def __getstate__(self):
+        #Sent to matcher's worker processes without the (possibly large) cache
+        state = dict(self.__dict__)
+        state["_cache"] = {}
+        return state
+
+    def key(self, item):
+        cached = self._cache.get(item)
+        if cached is None:
+            text = _APOSTROPHES.sub("", item.lower())
+            words = [singular(w) for w in _NOT_WORD.sub(" ", text).split()]
+            padded = " " + " ".join(self.synonyms.get(w, w) for w in words) + " "
+            for phrase, canonical in self._phrases:
+                padded = padded.replace(phrase, canonical)
+            cached = " ".join(padded.split())
+            self._cache[item] = cached
+        return cached
+
+
+class CandidateIndex:
+    #Word postings over the donation item keys of each category, so a wish's
+    #closest item name is found by looking only at names that share a word
+    #with it (never by comparing against every name).
+
+    def __init__(self, min_similarity=DEFAULT_MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self._postings = {}   #(category, word) -> item keys, in first-seen order
+        self._sizes = {}      #(category, item key) -> number of distinct words
+        self._rank = {}       #(category, item key) -> order it was added in
+        self._resolved = {}   #(category, item key) -> best (category, item key) or None
+
+    def add(self, category, item_key):
+        if (category, item_key) in self._sizes:
+            return
+        words = set(item_key.split())
+        self._sizes[(category, item_key)] = len(words)
+        self._rank[(category, item_key)] = len(self._rank)
+        for word in words:
+            self._postings.setdefault((category, word), []).append(item_key)
+        self._resolved.clear()
+
+    def best_match(self, category, item_key):
+        #Most similar indexed key in the same category, or None if nothing is
+        #similar enough. Ties go to the name that was indexed first.
+        key = (category, item_key)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        words = set(item_key.split())
+        overlap = {}
+        for word in words:
+            for candidate in self._postings.get((category, word), ()):
+                overlap[candidate] = overlap.get(candidate, 0) + 1
+
+        best = None
+        best_score = (0.0, 0)
+        for candidate, shared in overlap.items():
+            union = len(words) + self._sizes[(category, candidate)] - shared
+            score = (shared / union, -self._rank[(category, candidate)])
+            if score > best_score:
+                best, best_score = candidate, score
+
+        result = (category, best) if best is not None and best_score[0] >= self.min_similarity else None
+        self._resolved[key] = result
+        return result
@@ -0,0 +1,207 @@
+#perf.py - startup timing report and hot-path instrumentation (no Tk dependency)
+#
+#Entry points import this first and call mark() at each startup step.
+#Set MERRYMATCH_TIMINGS=1 to have the report printed to stderr.
+import functools
+import os
+import sys
+import threading
+import time
+import types
+from collections import deque
+
+REPORT_ENV = "MERRYMATCH_TIMINGS"
+
+_started = time.perf_counter()
+_marks = []   #(label, seconds since this module was imported)
+_reported = False
+
+
+def mark(label):
+    #Records that startup reached label (ignored once the report was printed)
+    if not _reported:
+        _marks.append((label, time.perf_counter() - _started))
+
+
+def startup_report():
+    #One line per mark: time since start and time since the previous mark
+    lines = []
+    previous = 0.0
+    for label, seconds in _marks:
+        lines.append(f"{label:<24}{seconds * 1000:9.1f} ms  (+{(seconds - previous) * 1000:.1f} ms)")
+        previous = seconds
+    return "\n".join(lines)
+
+
+def print_startup_report():
+    #Ends startup; the report is printed (once) only when REPORT_ENV is set
+    global _reported
+    if not _reported and os.environ.get(REPORT_ENV):
+        print("Startup timings:\n" + startup_report(), file=sys.stderr)
+    _reported = True
+
+
+#Hot-path instrumentation. instrument() wraps a function so every call adds
+#its time, the SQL statements it ran (counted by count_query, which
+#data_manager's connections call for each execute) and the rows it returned
+#to the stats for its name. snapshot() is what the diagnostics window shows.
+
+#Recent calls kept per operation for the latency figures
+RECENT_CALLS = 100
+
+#Finished profiles are written here as <operation>.prof
+PROFILE_DIR = "profiles"
+
+_stats = {}                  #operation name -> OpStats
+_stats_lock = threading.Lock()
+_thread = threading.local()  #per-thread SQL statement counter
+_profile_next = set()        #operations to run under cProfile on their next call
+_profiles = {}               #operation name -> text summary of its last profile
+
+
+class OpStats:
+    __slots__ = ("calls", "seconds", "slowest", "recent", "queries", "rows")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        self.recent = deque(maxlen=RECENT_CALLS)
+        self.queries = 0
+        self.rows = 0
+
+
+def count_query():
+    #Called once per SQL statement (or executemany batch) run on this thread
+    _thread.queries = getattr(_thread, "queries", 0) + 1
+
+
+def queries_run():
+    #SQL statements run so far on this thread
+    return getattr(_thread, "queries", 0)
+
+
+def record(name, seconds, queries=0, rows=0):
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = OpStats()
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.slowest = max(stats.slowest, seconds)
+        stats.recent.append(seconds)
+        stats.queries += queries
+        stats.rows += rows
+
+
+def _row_count(result):
+    #Rows handed back by a call: list length, or the count a bulk insert returns
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return 0
+
+
+def instrument(name=None):
+    #Decorator recording time, SQL statements and rows for every call. A
+    #generator is timed while it is consumed (chunk by chunk) and recorded
+    #when it finishes.
+    def decorate(fn):
+        op = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if op in _profile_next:
+                return _profiled(op, fn, args, kwargs)
+            queries = queries_run()
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                return _timed_chunks(op, result, time.perf_counter() - start, queries_run() - queries)
+            record(op, time.perf_counter() - start, queries_run() - queries, _row_count(result))
+            return result
+        return wrapper
+    return decorate
+
+
+def _timed_chunks(op, chunks, seconds, queries):
+    rows = 0
+    try:
+        while True:
+            before = queries_run()
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+                queries += queries_run() - before
+            rows += len(chunk)
+            yield chunk
+    finally:
+        chunks.close()
+        record(op, seconds, queries, rows)
+
+
+def profile_next(name):
+    #Runs the next call of the named operation under cProfile (on whichever
+    #thread it happens); the result goes to PROFILE_DIR and profile_summary()
+    with _stats_lock:
+        _profile_next.add(name)
+
+
+def profile_summary(name):
+    return _profiles.get(name)
+
+
+def _profiled(op, fn, args, kwargs):
+    #cProfile/pstats are slow to import, so only profiling runs pay for them
+    import cProfile
+    import io
+    import pstats
+    with _stats_lock:
+        _profile_next.discard(op)
+    profiler = cProfile.Profile()
+    queries = queries_run()
+    start = time.perf_counter()
+    try:
+        result = profiler.runcall(fn, *args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{op}.prof"))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(25)
+        _profiles[op] = text.getvalue()
+    #Generators are not timed chunk by chunk here; the profile covers creating them
+    record(op, seconds, queries_run() - queries, _row_count(result))
+    return result
+
+
+def snapshot():
+    #One dict per operation, slowest total first
+    with _stats_lock:
+        items = [(name, stats.calls, stats.seconds, stats.slowest, sorted(stats.recent),
+                  stats.queries, stats.rows) for name, stats in _stats.items()]
+    rows = []
+    for name, calls, seconds, slowest, recent, queries, rows_seen in items:
+        rows.append({
+            "operation": name,
+            "calls": calls,
+            "total_ms": seconds * 1000,
+            "avg_ms": seconds / calls * 1000,
+            "last_p50_ms": recent[len(recent) // 2] * 1000,
+            "last_p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000,
+            "max_ms": slowest * 1000,
+            "queries": queries,
+            "rows": rows_seen,
+        })
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
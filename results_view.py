@@ -0,0 +1,89 @@
+#results_view.py - Wishy Matchy results area that fills in a chunk at a time
+import tkinter as tk
+from itertools import islice
+
+from matcher import match_text
+from perf import instrument
+
+#Donors listed by name in the summary; the rest are only counted
+TOP_DONORS = 10
+
+
+class MatchResults:
+    #Wraps the results Text widget. show() writes the grouped summary right
+    #away and then the match lines chunk_size at a time from after()
+    #callbacks, so 100k matches never become one huge string and the window
+    #keeps responding while they fill in. Lines are only formatted when their
+    #chunk is inserted. message() and clear() stop a fill still running.
+
+    def __init__(self, text, chunk_size=1000, delay_ms=1):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.delay_ms = delay_ms
+        self._after_id = None
+        self._pending = None     #iterator over the allocations still to insert
+        self._shown = 0
+        self._total = 0
+
+    @property
+    def filling(self):
+        return self._pending is not None
+
+    def clear(self):
+        self._stop()
+        self.text.delete("1.0", tk.END)
+
+    def message(self, text):
+        self.clear()
+        self.text.insert(tk.END, text)
+
+    def note(self, text):
+        #Adds a line below the summary, where it stays visible while the match
+        #lines are still filling in
+        index = "notes" if "notes" in self.text.mark_names() else tk.END
+        self.text.insert(index, f" {text}\n")
+
+    def show(self, allocations, summary):
+        #allocations: (donation, wish, qty_matched) as applied; summary: their MatchSummary
+        self.clear()
+        self.text.insert(tk.END, " MATCHING RESULTS \n\n")
+        self.text.insert(tk.END, "\n".join(self._summary_lines(summary)) + "\n\n\n")
+        #"notes" sits before the blank line above the match lines; it has right
+        #gravity, so each note lands after the one before
+        self.text.mark_set("notes", tk.END + "-2c")
+        self.text.mark_gravity("notes", tk.RIGHT)
+        self._pending = iter(allocations)
+        self._shown = 0
+        self._total = len(allocations)
+        self._insert_chunk()
+
+    def _summary_lines(self, summary):
+        lines = [f" Total Matches: {summary.matches} ({summary.units} items)", "", " By category:"]
+        for category, (matches, units) in sorted(summary.by_category.items()):
+            lines.append(f"   {category:<14}{matches:>8} matches {units:>8} items")
+        lines.append("")
+        lines.append(" Top donors:")
+        top = summary.top_donors(TOP_DONORS)
+        for donor, matches, units in top:
+            lines.append(f"   {donor:<24}{units:>8} items ({matches} matches)")
+        if len(summary.by_donor) > len(top):
+            lines.append(f"   ... and {len(summary.by_donor) - len(top)} more donors")
+        return lines
+
+    @instrument("gui.match_results_chunk")
+    def _insert_chunk(self):
+        self._after_id = None
+        chunk = list(islice(self._pending, self.chunk_size))
+        if chunk:
+            self.text.insert(tk.END, "\n".join(match_text(d, w, qty) for d, w, qty in chunk) + "\n")
+            self._shown += len(chunk)
+        if self._shown < self._total:
+            self._after_id = self.text.after(self.delay_ms, self._insert_chunk)
+        else:
+            self._pending = None
+
+    def _stop(self):
+        if self._after_id is not None:
+            self.text.after_cancel(self._after_id)
+            self._after_id = None
+        self._pending = None
@@ -0,0 +1,84 @@
+#stats.py - running totals for the stats labels (no Tk dependency)
+import heapq
+
+
+class RecordStats:
+    #Totals for one list of records (donations or wishes), kept current by
+    #telling it about every add, edit and remove instead of rescanning the list.
+    #open_status is the status whose quantity still counts as open:
+    #"Available" for donations, "Pending" for wishes.
+
+    def __init__(self, open_status):
+        self.open_status = open_status
+        self.clear()
+
+    def clear(self):
+        self.total = 0                #number of records
+        self.open_quantity = 0        #quantity still available/pending
+        self.category_counts = {}     #category -> number of records
+        self.category_open = {}       #category -> open quantity
+        self.status_counts = {}       #status -> number of records
+        self._counted = {}            #id(record) -> (category, status, quantity) as last counted
+
+    def add(self, record):
+        snapshot = (record.category, record.status, record.quantity)
+        self._counted[id(record)] = snapshot
+        self._apply(snapshot, 1)
+
+    def add_many(self, records):
+        for record in records:
+            self.add(record)
+
+    def remove(self, record):
+        snapshot = self._counted.pop(id(record), None)
+        if snapshot is not None:
+            self._apply(snapshot, -1)
+
+    def update(self, record):
+        #Call after changing a record's category, status or quantity
+        self.remove(record)
+        self.add(record)
+
+    def _apply(self, snapshot, sign):
+        category, status, quantity = snapshot
+        self.total += sign
+        self.category_counts[category] = self.category_counts.get(category, 0) + sign
+        self.status_counts[status] = self.status_counts.get(status, 0) + sign
+        if status == self.open_status and quantity > 0:
+            self.open_quantity += sign * quantity
+            self.category_open[category] = self.category_open.get(category, 0) + sign * quantity
+
+
+def category_breakdown(donation_stats, wish_stats):
+    #(category, available quantity, pending quantity) for every category seen
+    categories = sorted(set(donation_stats.category_counts) | set(wish_stats.category_counts))
+    return [(c, donation_stats.category_open.get(c, 0), wish_stats.category_open.get(c, 0))
+            for c in categories
+            if donation_stats.category_counts.get(c) or wish_stats.category_counts.get(c)]
+
+
+class MatchSummary:
+    #Totals for one matching run per category and per donor, added up as each
+    #match is applied (so the results area never has to re-read its lines)
+
+    def __init__(self):
+        self.matches = 0
+        self.units = 0
+        self.by_category = {}   #category -> [matches, units]
+        self.by_donor = {}      #donor -> [matches, units]
+
+    def add(self, donation, wish, qty_matched):
+        self.matches += 1
+        self.units += qty_matched
+        for totals, key in ((self.by_category, donation.category), (self.by_donor, donation.donor)):
+            counts = totals.get(key)
+            if counts is None:
+                totals[key] = [1, qty_matched]
+            else:
+                counts[0] += 1
+                counts[1] += qty_matched
+
+    def top_donors(self, n):
+        #The n donors who gave the most units: [(donor, matches, units)]
+        ranked = heapq.nlargest(n, self.by_donor.items(), key=lambda item: item[1][1])
+        return [(donor, matches, units) for donor, (matches, units) in ranked]
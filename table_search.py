@@ -0,0 +1,101 @@
+#table_search.py - search box and sortable column headings for a VirtualTable
+import tkinter as tk
+
+#Heading suffixes for the sorted column
+SORT_ARROWS = {False: " ▲", True: " ▼"}
+
+
+class TableSearch:
+    #While there is search text or a sorted column, the table pages its rows
+    #out of the database (search(text, sort, descending, limit, offset) run on
+    #worker) instead of showing the records loaded in memory. resolve(rows)
+    #turns each page into the objects the table should show. Clicking a
+    #heading cycles ascending -> descending -> unsorted.
+
+    def __init__(self, parent, view, headings, search, count, worker, resolve, delay_ms=300):
+        self.view = view
+        self.headings = headings  #column -> heading text
+        self.search = search
+        self.count = count
+        self.worker = worker
+        self.resolve = resolve
+        self.delay_ms = delay_ms
+
+        self.sort = None          #(column, descending) or None
+        self._after_id = None
+        self._counted = None      #search text the count label is for
+
+        self.frame = tk.Frame(parent)
+        tk.Label(self.frame, text="SEARCH:", font=("fixedsys", 10)).pack(side="left", padx=5)
+        self.text_var = tk.StringVar()
+        self.text_var.trace_add("write", self._schedule)
+        tk.Entry(self.frame, textvariable=self.text_var, width=30,
+                 font=("fixedsys", 10)).pack(side="left", padx=5)
+        tk.Button(self.frame, text="Clear", command=self.clear,
+                  font=("fixedsys", 10)).pack(side="left", padx=5)
+        self.count_label = tk.Label(self.frame, text="", font=("fixedsys", 10))
+        self.count_label.pack(side="left", padx=5)
+
+        for column, text in headings.items():
+            view.tree.heading(column, text=text, command=lambda c=column: self.toggle_sort(c))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def clear(self):
+        self.text_var.set("")
+
+    def toggle_sort(self, column):
+        if self.sort is None or self.sort[0] != column:
+            self.sort = (column, False)
+        elif not self.sort[1]:
+            self.sort = (column, True)
+        else:
+            self.sort = None
+        for name, text in self.headings.items():
+            arrow = SORT_ARROWS[self.sort[1]] if self.sort and self.sort[0] == name else ""
+            self.view.tree.heading(name, text=text + arrow)
+        self.apply()
+
+    def rerun(self):
+        #Searches again (e.g. after a record was added), keeping the text and sort
+        self._counted = None
+        self.apply()
+
+    def _schedule(self, *_):
+        #Waits for a pause in typing before searching
+        if self._after_id is not None:
+            self.frame.after_cancel(self._after_id)
+        self._after_id = self.frame.after(self.delay_ms, self.apply)
+
+    def apply(self):
+        #Runs the current search/sort, or goes back to the loaded records
+        if self._after_id is not None:
+            self.frame.after_cancel(self._after_id)
+            self._after_id = None
+        text = self.text_var.get().strip()
+        if not text and self.sort is None:
+            self._counted = None
+            self.count_label.config(text="")
+            self.view.set_source(None)
+            return
+
+        #Unsorted search results come newest first, like the loaded records
+        sort, descending = self.sort or ("created_at", True)
+
+        def fetch(offset, limit, deliver):
+            self.worker.submit(self.search, text, sort, descending, limit, offset,
+                               on_done=lambda rows: deliver(self.resolve(rows)))
+        self.view.set_source(fetch)
+
+        if text != self._counted:
+            self._counted = text
+            self.count_label.config(text="Searching..." if text else "")
+            if text:
+                self.worker.submit(self.count, text, on_done=self._show_count(text))
+
+    def _show_count(self, text):
+        def show(found):
+            if self._counted == text:
+                self.count_label.config(text=f"{found} FOUND")
+        return show
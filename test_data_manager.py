@@ -0,0 +1,260 @@
+#test_data_manager.py - database layer on a fresh file per test (run with pytest)
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import data_manager
+from donation import Donation
+from matcher import apply_match, find_matches
+from wish import Wish
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / "merry_match.db")
+    monkeypatch.setattr(data_manager, "DATABASE_FILE", path)
+    yield path
+    data_manager.disable_write_behind()
+    data_manager.close_connections()
+
+
+def donation_rows():
+    #What is in the file, read past the write-behind buffer
+    conn = sqlite3.connect(data_manager.DATABASE_FILE)
+    try:
+        return conn.execute("SELECT id, donor, item, quantity FROM donations ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def crash():
+    #Drops the write-behind buffer the way a crash would: nothing written,
+    #the journal left as it is and its lock released
+    data_manager._writes.journal.close()
+    data_manager._writes = None
+
+
+#Write-behind
+
+OTHER_PROGRAM = """
+import sys
+import data_manager
+from donation import Donation
+from matcher import apply_match, find_matches
+from wish import Wish
+data_manager.DATABASE_FILE = sys.argv[1]
+assert data_manager.enable_write_behind()
+print(data_manager._writes.name)
+assert data_manager.add_donation(Donation("Other", "Kite", 2, "Toys", "Available", "2025-12-01"))
+assert data_manager.disable_write_behind()
+"""
+
+
+def test_second_program_gets_its_own_journal(database):
+    assert data_manager.enable_write_behind()
+    assert data_manager.add_donation(Donation("Mine", "Ball", 1, "Toys", "Available", "2025-12-01"))
+    mine = data_manager._writes.name
+    other = subprocess.run([sys.executable, "-c", OTHER_PROGRAM, database], cwd=HERE,
+                           capture_output=True, text=True, check=True).stdout.split()[0]
+    assert other != mine
+    #The other program neither replayed nor wrote this program's pending add
+    assert [row[1] for row in donation_rows()] == ["Other"]
+    assert data_manager.add_donation(Donation("Mine", "Doll", 3, "Toys", "Available", "2025-12-01"))
+    assert data_manager.disable_write_behind()
+    assert sorted(row[1:] for row in donation_rows()) == [
+        ("Mine", "Ball", 1), ("Mine", "Doll", 3), ("Other", "Kite", 2)]
+
+
+def test_crash_replays_journal_once(database):
+    assert data_manager.enable_write_behind()
+    kept = Donation("Kept", "Ball", 1, "Toys", "Available", "2025-12-01")
+    dropped = Donation("Dropped", "Doll", 1, "Toys", "Available", "2025-12-01")
+    assert data_manager.add_donation(kept)
+    assert data_manager.add_donation(dropped)
+    kept.quantity = 5
+    assert data_manager.update_donation(kept)
+    assert data_manager.delete_donation(dropped.id)
+    crash()
+
+    assert data_manager.enable_write_behind()
+    assert donation_rows() == [(kept.id, "Kept", "Ball", 5)]
+    crash()
+    #Replaying again (the journal was emptied) changes nothing
+    assert data_manager.enable_write_behind()
+    assert donation_rows() == [(kept.id, "Kept", "Ball", 5)]
+
+
+def test_line_written_before_crash_is_not_applied_again(database):
+    assert data_manager.enable_write_behind()
+    journal_path = data_manager._writes.journal.name
+    donation = Donation("Once", "Ball", 1, "Toys", "Available", "2025-12-01")
+    assert data_manager.add_donation(donation)
+    with open(journal_path, encoding="utf-8") as f:
+        lines = f.read()
+    assert data_manager.flush_writes() == []
+    crash()
+    #A crash after the write committed but before the journal was emptied
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write(lines)
+    assert data_manager.enable_write_behind()
+    assert donation_rows() == [(donation.id, "Once", "Ball", 1)]
+    crash()
+
+    #Even without the record of what was written, the add is not made twice
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write(lines)
+    with data_manager.transaction() as conn:
+        conn.execute("DELETE FROM journal_flushes")
+    assert data_manager.enable_write_behind()
+    assert donation_rows() == [(donation.id, "Once", "Ball", 1)]
+    assert data_manager.add_donation(Donation("Next", "Doll", 1, "Toys", "Available", "2025-12-01"))
+    assert data_manager.disable_write_behind()
+    assert [row[1] for row in donation_rows()] == ["Once", "Next"]
+
+
+#Match queue
+
+def add(item, donated, wished, category="Toys"):
+    donation = Donation("Donor", item, donated, category, "Available", "2025-12-01")
+    wish = Wish("Recipient", item, wished, category, "Pending", "2025-12-01")
+    assert data_manager.add_donation(donation) and data_manager.add_wish(wish)
+    return donation, wish
+
+
+def plan(keys):
+    #A run's matches, on its own copies of the open rows for keys
+    return find_matches(data_manager.load_open_donations(keys), data_manager.load_open_wishes(keys))
+
+
+def save(matches, claim, requeue=()):
+    for donation, wish, qty_matched in matches:
+        apply_match(donation, wish, qty_matched)
+    return data_manager.save_match_results([m[0] for m in matches], [m[1] for m in matches],
+                                           matches, claim, requeue)
+
+
+def ledger():
+    with data_manager.connection() as conn:
+        return conn.execute("SELECT donation_id, wish_id, quantity FROM matches ORDER BY id").fetchall()
+
+
+def test_saved_run_clears_only_its_own_claim(database):
+    add("Kite", 1, 1)
+    claim_a, keys_a = data_manager.pending_match_keys()
+    assert keys_a == [("Toys", "Kite")]
+    add("Ball", 1, 1)
+    #Another station's run starts before this one is saved, then is cancelled
+    claim_b, keys_b = data_manager.pending_match_keys()
+    assert claim_b != claim_a
+    assert sorted(keys_b) == [("Toys", "Ball"), ("Toys", "Kite")]
+    assert save(plan(keys_a), claim_a) == []
+    claim_c, keys_c = data_manager.pending_match_keys()
+    assert ("Toys", "Ball") in keys_c
+    assert save(plan(keys_c), claim_c) == []
+    assert len(ledger()) == 2
+    assert data_manager.pending_match_keys()[1] == []
+
+
+def test_change_during_run_stays_queued(database):
+    add("Kite", 1, 1)
+    claim, keys = data_manager.pending_match_keys()
+    matches = plan(keys)
+    add("Kite", 1, 1)
+    assert save(matches, claim) == []
+    assert data_manager.pending_match_keys()[1] == [("Toys", "Kite")]
+
+
+def test_match_taken_elsewhere_is_left_out_and_requeued(database):
+    donation, first_wish = add("Kite", 2, 2)
+    second_wish = Wish("Other", "Kite", 2, "Toys", "Pending", "2025-12-01")
+    assert data_manager.add_wish(second_wish)
+    claim, keys = data_manager.pending_match_keys()
+    #Two stations plan the same run; the other one saves first
+    mine = plan(keys)
+    theirs = plan(keys)
+    assert save(theirs, None) == []
+    left_out = save(mine, claim)
+    assert len(left_out) == 1
+    #The records left out are back to what the database holds
+    assert (left_out[0][0].quantity, left_out[0][0].status) == (0, "Matched")
+    assert len(ledger()) == 1
+    assert data_manager.pending_match_keys()[1] == [("Toys", "Kite")]
+
+
+def test_matches_that_still_fit_are_saved(database):
+    add("Kite", 3, 1)
+    add("Ball", 1, 1)
+    claim, keys = data_manager.pending_match_keys()
+    mine = plan(keys)
+    #Another station edits the Kite donation: the version changes, the units still fit
+    with data_manager.transaction("donations") as conn:
+        conn.execute("UPDATE donations SET donor = 'Renamed', version = version + 1 WHERE item = 'Kite'")
+    assert save(mine, claim) == []
+    assert len(ledger()) == 2
+    kite = next(donation for donation, _, _ in mine if donation.item == "Kite")
+    assert (kite.quantity, data_manager.get_donation(kite.id).quantity) == (2, 2)
+
+
+def test_requeue_keeps_skipped_pairs(database):
+    add("Kite", 1, 1)
+    claim, keys = data_manager.pending_match_keys()
+    assert save([], claim, requeue=[("Toys", "Kite")]) == []
+    assert data_manager.pending_match_keys()[1] == [("Toys", "Kite")]
+
+
+#Migrations
+
+def baseline_database(path):
+    #A database as the first release left it: tables and indexes, no user_version
+    conn = sqlite3.connect(path)
+    data_manager._create_tables(conn)
+    conn.execute("INSERT INTO donations (donor, item, quantity, category, date) "
+                 "VALUES ('Ann', 'Teddy Bear', 2, 'Toys', '2025-12-01')")
+    conn.execute("INSERT INTO wishes (recipient, item, quantity, category, date) "
+                 "VALUES ('Ben', 'teddy bear', 1, 'Toys', '2025-12-02')")
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_database_is_upgraded(database):
+    baseline_database(database)
+    data_manager.init_database()
+    with data_manager.connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(data_manager.MIGRATIONS)
+        assert conn.execute("SELECT item_key FROM donations").fetchone()[0] == "teddy bear"
+        assert conn.execute("SELECT rowid FROM donations_fts WHERE donations_fts MATCH 'teddy'").fetchone()[0] == 1
+    assert [d.donor for d in data_manager.search_donations("bear")] == ["Ann"]
+    #What was open before the upgrade is queued for matching
+    assert data_manager.pending_match_keys()[1] == [("Toys", "teddy bear")]
+
+
+def test_migration_from_two_connections(database):
+    baseline_database(database)
+    first = sqlite3.connect(database, timeout=5)
+
+    class Racing(sqlite3.Connection):
+        #Lets the first connection run every migration after this one has
+        #read user_version, and before it takes the write lock
+        raced = False
+
+        def execute(self, sql, *args):
+            if sql == "BEGIN IMMEDIATE" and not Racing.raced:
+                Racing.raced = True
+                data_manager._migrate(first)
+            return super().execute(sql, *args)
+
+    second = sqlite3.connect(database, timeout=5, factory=Racing)
+    try:
+        data_manager._migrate(second)
+        assert Racing.raced
+        for conn in (first, second):
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == len(data_manager.MIGRATIONS)
+        assert second.execute("SELECT count(*) FROM donations_fts").fetchone()[0] == 1
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,236 @@
+#test_matcher.py - find_matches against the original nested loop (run with pytest)
+import random
+
+import pytest
+
+import matcher
+from donation import Donation
+from matcher import STRATEGIES, apply_match, fair_shares, find_matches, resolve_fuzzy_keys
+from normalize import ItemNormalizer
+from wish import Wish
+
+CATEGORIES = ["Toys", "Clothes", "Food"]
+#Few names, in several spellings, so many records share a key
+ITEMS = ["Teddy Bear", "teddy bear", "TEDDY BEAR", "Coat", "coat", "Rice", "Scarf"]
+
+
+def nested_loop(donations, wishes):
+    #The loop Merrymatch.auto_match used before matcher.py, on copies of the
+    #records. Returns (donation_pos, wish_pos, qty_matched) in the order it
+    #made them, and the copies as they were left.
+    donations = [Donation(d.donor, d.item, d.quantity, d.category, d.status, d.date) for d in donations]
+    wishes = [Wish(w.recipient, w.item, w.quantity, w.category, w.status, w.date) for w in wishes]
+    donations_for_match = [(i, d) for i, d in enumerate(donations) if d.status == "Available" and d.quantity > 0]
+    wishes_for_match = [(i, w) for i, w in enumerate(wishes) if w.status == "Pending" and w.quantity > 0]
+    matches = []
+    for w_pos, wish in wishes_for_match:
+        for d_pos, donation in donations_for_match:
+            if donation.category == wish.category and donation.item.lower() == wish.item.lower():
+                qty_matched = min(donation.quantity, wish.quantity)
+                if qty_matched > 0:
+                    matches.append((d_pos, w_pos, qty_matched))
+                    apply_match(donation, wish, qty_matched)
+                    if wish.quantity == 0:
+                        break
+    return matches, donations, wishes
+
+
+def random_records(rng, donation_count, wish_count, max_quantity=6):
+    #Mostly open records with quantities that split across several matches,
+    #plus some closed or empty ones the matcher has to skip
+    def fields():
+        status_roll = rng.random()
+        quantity = 0 if status_roll < 0.05 else rng.randint(1, max_quantity)
+        return rng.choice(ITEMS), quantity, rng.choice(CATEGORIES), status_roll
+    donations = []
+    for i in range(donation_count):
+        item, quantity, category, roll = fields()
+        status = "Matched" if roll > 0.95 else "Available"
+        donations.append(Donation(f"Donor {i}", item, quantity, category, status, "2025-12-01", id=i))
+    wishes = []
+    for i in range(wish_count):
+        item, quantity, category, roll = fields()
+        status = "Fulfilled" if roll > 0.95 else "Pending"
+        wishes.append(Wish(f"Recipient {i}", item, quantity, category, status, "2025-12-01", id=i))
+    return donations, wishes
+
+
+def as_positions(allocations, donations, wishes):
+    donation_pos = {id(d): i for i, d in enumerate(donations)}
+    wish_pos = {id(w): i for i, w in enumerate(wishes)}
+    return [(donation_pos[id(d)], wish_pos[id(w)], qty) for d, w, qty in allocations]
+
+
+def with_dates(rng, wishes):
+    for wish in wishes:
+        wish.date = f"2025-12-{rng.randint(1, 28):02d}"
+    return wishes
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("donation_count, wish_count", [(0, 10), (10, 0), (30, 30), (200, 50), (50, 200)])
+def test_same_allocations_as_nested_loop(seed, donation_count, wish_count):
+    rng = random.Random(seed)
+    donations, wishes = random_records(rng, donation_count, wish_count)
+    expected, _, _ = nested_loop(donations, wishes)
+    assert as_positions(find_matches(donations, wishes), donations, wishes) == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_same_allocations_as_nested_loop_at_scale(seed):
+    #Thousands of records on a handful of keys: long buckets, many splits
+    rng = random.Random(seed)
+    donations, wishes = random_records(rng, 3000, 3000, max_quantity=20)
+    expected, _, _ = nested_loop(donations, wishes)
+    assert as_positions(find_matches(donations, wishes), donations, wishes) == expected
+
+
+def test_applied_records_end_like_nested_loop():
+    rng = random.Random(7)
+    donations, wishes = random_records(rng, 300, 300)
+    _, expected_donations, expected_wishes = nested_loop(donations, wishes)
+    for donation, wish, qty_matched in find_matches(donations, wishes):
+        apply_match(donation, wish, qty_matched)
+    assert [(d.quantity, d.status) for d in donations] == [(d.quantity, d.status) for d in expected_donations]
+    assert [(w.quantity, w.status) for w in wishes] == [(w.quantity, w.status) for w in expected_wishes]
+
+
+def test_quantity_split_over_donations_and_wishes():
+    #One wish takes from three donations; the last donation's rest goes to the next wish
+    donations = [Donation(f"D{i}", "Teddy Bear", qty, "Toys", "Available", "2025-12-01")
+                 for i, qty in enumerate((2, 3, 4))]
+    wishes = [Wish("R0", "teddy bear", 6, "Toys", "Pending", "2025-12-01"),
+              Wish("R1", "TEDDY BEAR", 5, "Toys", "Pending", "2025-12-01")]
+    assert as_positions(find_matches(donations, wishes), donations, wishes) == [
+        (0, 0, 2), (1, 0, 3), (2, 0, 1), (2, 1, 3)]
+
+
+def test_needs_same_category_and_item():
+    donations = [Donation("D", "Coat", 5, "Clothes", "Available", "2025-12-01")]
+    wishes = [Wish("R0", "Coat", 1, "Toys", "Pending", "2025-12-01"),
+              Wish("R1", "Coats", 1, "Clothes", "Pending", "2025-12-01")]
+    assert find_matches(donations, wishes) == []
+
+
+def test_leaves_records_unchanged():
+    rng = random.Random(3)
+    donations, wishes = random_records(rng, 100, 100)
+    before = [r.to_dict() for r in donations + wishes]
+    find_matches(donations, wishes)
+    assert [r.to_dict() for r in donations + wishes] == before
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("fuzzy", [False, True])
+def test_process_pool_matches_like_one_process(strategy, fuzzy, monkeypatch):
+    #min_records=0 sends even this small run through allocate_partitioned
+    pooled = []
+    allocate_partitioned = matcher.allocate_partitioned
+    monkeypatch.setattr(matcher, "allocate_partitioned",
+                        lambda *args, **kwargs: pooled.append(1) or allocate_partitioned(*args, **kwargs))
+    rng = random.Random(11)
+    donations, wishes = random_records(rng, 400, 400)
+    with_dates(rng, wishes)
+    normalizer = ItemNormalizer() if fuzzy else None
+    serial = find_matches(donations, wishes, normalizer=normalizer, strategy=strategy)
+    parallel = find_matches(donations, wishes, normalizer=normalizer, strategy=strategy,
+                            workers=2, min_records=0)
+    assert serial and pooled == [1]
+    assert as_positions(parallel, donations, wishes) == as_positions(serial, donations, wishes)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_oldest_first_is_nested_loop_over_wishes_by_date(seed):
+    rng = random.Random(seed)
+    donations, wishes = random_records(rng, 100, 150)
+    with_dates(rng, wishes)
+    by_date = sorted(wishes, key=lambda w: w.date)   #stable: list order among equal dates
+    expected, _, _ = nested_loop(donations, by_date)
+    expected = [(d, wishes.index(by_date[w]), qty) for d, w, qty in expected]
+    allocations = find_matches(donations, wishes, strategy="oldest_first")
+    assert as_positions(allocations, donations, wishes) == expected
+
+
+def test_oldest_first_serves_oldest_wishes():
+    donations = [Donation("D", "Kite", 2, "Toys", "Available", "2025-11-01")]
+    wishes = [Wish(f"R{day}", "Kite", 1, "Toys", "Pending", f"2025-12-0{day}") for day in (3, 1, 2)]
+    assert as_positions(find_matches(donations, wishes), donations, wishes) == [(0, 0, 1), (0, 1, 1)]
+    assert as_positions(find_matches(donations, wishes, strategy="oldest_first"),
+                        donations, wishes) == [(0, 1, 1), (0, 2, 1)]
+
+
+@pytest.mark.parametrize("demands, supply, shares", [
+    ([1, 5, 5], 7, [1, 3, 3]),
+    ([4, 4, 4], 10, [4, 3, 3]),
+    ([5, 1, 5], 4, [2, 1, 1]),
+    ([2, 3], 9, [2, 3]),
+    ([3, 3], 0, [0, 0]),
+])
+def test_fair_shares_examples(demands, supply, shares):
+    assert fair_shares(demands, supply) == shares
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_fair_shares_are_max_min_fair(seed):
+    rng = random.Random(seed)
+    demands = [rng.randint(1, 10) for _ in range(rng.randint(1, 12))]
+    supply = rng.randint(0, sum(demands) + 5)
+    shares = fair_shares(demands, supply)
+    #Nobody gets more than they asked for, and the supply is used up
+    assert all(0 <= share <= demand for share, demand in zip(shares, demands))
+    assert sum(shares) == min(supply, sum(demands))
+    #Someone left short gets at most one unit less than anyone else, and
+    #the spare units went to the earliest of them
+    short = [i for i, (share, demand) in enumerate(zip(shares, demands)) if share < demand]
+    for i in short:
+        assert all(share <= shares[i] + 1 for share in shares)
+    assert [shares[i] for i in short] == sorted((shares[i] for i in short), reverse=True)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_fair_strategy_gives_each_key_its_fair_shares(seed):
+    rng = random.Random(seed)
+    donations, wishes = random_records(rng, 60, 120, max_quantity=8)
+    with_dates(rng, wishes)
+    allocations = find_matches(donations, wishes, strategy="fair")
+    received = {}
+    given = {}
+    for donation, wish, qty in allocations:
+        received[id(wish)] = received.get(id(wish), 0) + qty
+        given[id(donation)] = given.get(id(donation), 0) + qty
+    assert all(given[id(d)] <= d.quantity for d in donations if id(d) in given)
+
+    open_donations = [d for d in donations if d.status == "Available" and d.quantity > 0]
+    open_wishes = [w for w in wishes if w.status == "Pending" and w.quantity > 0]
+    for category in CATEGORIES:
+        for item in {i.lower() for i in ITEMS}:
+            key_wishes = sorted((w for w in open_wishes if (w.category, w.item.lower()) == (category, item)),
+                                key=lambda w: w.date)
+            supply = sum(d.quantity for d in open_donations
+                         if (d.category, d.item.lower()) == (category, item))
+            if key_wishes and supply:
+                assert [received.get(id(w), 0) for w in key_wishes] == fair_shares(
+                    [w.quantity for w in key_wishes], supply)
+
+
+def test_fuzzy_names_match_across_spellings():
+    donations = [Donation("D0", "Teddy Bears", 2, "Toys", "Available", "2025-12-01"),
+                 Donation("D1", "Red Kite", 1, "Toys", "Available", "2025-12-01"),
+                 Donation("D2", "Kite", 1, "Clothes", "Available", "2025-12-01")]
+    wishes = [Wish("R0", "teddy-bear", 1, "Toys", "Pending", "2025-12-01"),
+              Wish("R1", "kites", 1, "Toys", "Pending", "2025-12-01"),
+              Wish("R2", "Big Red Kite Set", 1, "Toys", "Pending", "2025-12-01")]
+    assert as_positions(find_matches(donations, wishes), donations, wishes) == []
+    fuzzy = find_matches(donations, wishes, normalizer=ItemNormalizer())
+    #"kites" is close enough to "red kite"; "big red kite set" (2 of 4 words) is too
+    assert as_positions(fuzzy, donations, wishes) == [(0, 0, 1), (1, 1, 1)]
+
+
+def test_fuzzy_keys_prefer_an_exact_name():
+    donation_keys = [("Toys", "red kite"), ("Toys", "kite"), ("Clothes", "coat")]
+    wish_keys = [("Toys", "kite"), ("Toys", "red kite"), ("Toys", "blue kite"),
+                 ("Toys", "coat"), ("Toys", "doll")]
+    #"blue kite" shares 1 of 2 words with "kite", 1 of 3 with "red kite";
+    #similar names are only looked for in the same category
+    assert resolve_fuzzy_keys(donation_keys, wish_keys) == [
+        ("Toys", "kite"), ("Toys", "red kite"), ("Toys", "kite"), ("Toys", "coat"), ("Toys", "doll")]
@@ -0,0 +1,38 @@
+#test_merrymatch_cli.py - checks on imported rows (run with pytest)
+from merrymatch_cli import record_rows
+
+
+def rows(*records, record_type="donations"):
+    counts = {"rows": 0, "errors": []}
+    return list(record_rows(enumerate(records, start=2), record_type, counts)), counts["errors"]
+
+
+def donation(**fields):
+    return {"donor": "Ann", "item": "Kite", "quantity": "2", "category": "Toys", **fields}
+
+
+def test_good_rows_get_default_status_and_date():
+    good, errors = rows(donation(date="2025-12-01"), donation(quantity="0", status="Matched", date="2024-02-29"))
+    assert errors == []
+    assert good == [("Ann", "Kite", 2, "Toys", "Available", "2025-12-01"),
+                    ("Ann", "Kite", 0, "Toys", "Matched", "2024-02-29")]
+    wishes, errors = rows({"recipient": "Ben", "item": "Kite", "quantity": 0, "category": "Toys"},
+                          record_type="wishes")
+    assert errors == [] and wishes[0][4] == "Fulfilled" and len(wishes[0][5]) == 10
+
+
+def test_unknown_status_is_rejected():
+    good, errors = rows(donation(status="available"), donation(status="Pending"),
+                        donation(status="Available"))
+    assert len(good) == 1
+    assert errors == ["line 2: status 'available' is not 'Available' or 'Matched'",
+                      "line 3: status 'Pending' is not 'Available' or 'Matched'"]
+
+
+def test_date_must_be_yyyy_mm_dd():
+    good, errors = rows(donation(date="12/01/2025"), donation(date="2025-1-05"),
+                        donation(date="2025-02-30"), donation(date=20251201), donation(date="2025-12-01"))
+    assert len(good) == 1
+    assert [error.split(": ", 1)[1] for error in errors] == [
+        "date '12/01/2025' is not YYYY-MM-DD", "date '2025-1-05' is not YYYY-MM-DD",
+        "date '2025-02-30' is not YYYY-MM-DD", "date 20251201 is not YYYY-MM-DD"]
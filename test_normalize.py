@@ -0,0 +1,77 @@
+#test_normalize.py - fuzzy item names (run with pytest)
+import pytest
+
+from normalize import CandidateIndex, DEFAULT_MIN_SIMILARITY, ItemNormalizer, singular
+
+
+@pytest.mark.parametrize("item, key", [
+    ("Teddy Bear", "teddy bear"),
+    ("  TEDDY   BEAR ", "teddy bear"),
+    ("Teddy Bears", "teddy bear"),
+    ("teddy-bear", "teddy bear"),
+    ("Teddy Bear!", "teddy bear"),
+    ("Children's Books", "children book"),
+    ("Puppies", "puppy"),
+    ("Boxes", "box"),
+    ("Dresses", "dress"),
+    ("Glass", "glass"),
+    ("Bus", "bus"),
+    ("T-Shirts", "tshirt"),
+    ("Tee", "tshirt"),
+    ("Wool Jumper", "wool sweater"),
+    ("Sneakers", "shoe"),
+])
+def test_normalized_keys(item, key):
+    assert ItemNormalizer().key(item) == key
+
+
+def test_short_words_keep_their_s():
+    assert singular("gas") == "gas"
+    assert singular("toys") == "toy"
+
+
+def test_extra_synonyms():
+    #Matched after plurals are removed, so given in the singular
+    normalizer = ItemNormalizer({"stuffed animal": "teddy bear"})
+    assert normalizer.key("Stuffed Animals") == "teddy bear"
+    #The defaults still apply
+    assert normalizer.key("Jumper") == "sweater"
+
+
+def test_cache_is_not_pickled():
+    import pickle
+    normalizer = ItemNormalizer()
+    normalizer.key("Teddy Bears")
+    copy = pickle.loads(pickle.dumps(normalizer))
+    assert copy._cache == {} and copy.key("Teddy Bears") == "teddy bear"
+
+
+def index_of(*keys, category="Toys", **kwargs):
+    index = CandidateIndex(**kwargs)
+    for key in keys:
+        index.add(category, key)
+    return index
+
+
+def test_most_similar_name_in_the_category():
+    index = index_of("teddy bear", "red kite", "toy car")
+    assert index.best_match("Toys", "big teddy bear") == ("Toys", "teddy bear")
+    assert index.best_match("Toys", "kite") == ("Toys", "red kite")
+    assert index.best_match("Clothes", "teddy bear") is None
+    assert index.best_match("Toys", "doll") is None
+
+
+def test_similarity_threshold():
+    #"kite" shares 1 of 2 words with "red kite" and 1 of 3 with "big red kite"
+    assert DEFAULT_MIN_SIMILARITY == 0.5
+    assert index_of("red kite").best_match("Toys", "kite") == ("Toys", "red kite")
+    assert index_of("big red kite").best_match("Toys", "kite") is None
+    assert index_of("big red kite", min_similarity=0.3).best_match("Toys", "kite") == ("Toys", "big red kite")
+    assert index_of("red kite", min_similarity=0.6).best_match("Toys", "kite") is None
+
+
+def test_ties_go_to_the_first_name_added():
+    index = index_of("red kite", "blue kite")
+    assert index.best_match("Toys", "kite") == ("Toys", "red kite")
+    index.add("Toys", "kite")
+    assert index.best_match("Toys", "kite") == ("Toys", "kite")
@@ -0,0 +1,191 @@
+#virtual_table.py - paged Treeview that only creates rows as they scroll into view
+import tkinter as tk
+from tkinter import ttk
+
+from perf import instrument
+
+#Pages of rows kept in the Treeview at most; rows further away are removed
+WINDOW_PAGES = 3
+
+
+class VirtualTable:
+    #Wraps a ttk.Treeview showing a list of records (Donation or Wish objects).
+    #Only a window of at most WINDOW_PAGES pages of the list is turned into
+    #Treeview rows: scrolling near its bottom adds the next page and removes
+    #one from the top, and scrolling near its top does the reverse. refresh()
+    #compares against what is already on screen, so one edited record touches
+    #one Treeview row.
+    #
+    #With set_source() the rows come from a query instead (e.g. a database
+    #search), fetched a page at a time as the view scrolls.
+
+    def __init__(self, parent, columns, row_values, page_size=200, height=15):
+        self.row_values = row_values  #function: record -> tuple of column values
+        self.page_size = page_size
+
+        self.frame = tk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=height)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.records = []
+        self._start = 0           #position of the first materialized record
+        self._limit = page_size   #how many records from there may be materialized
+        self._order = []          #iids currently in the tree, top to bottom
+        self._values = {}         #iid -> values last written to the tree
+        self._records_by_iid = {} #iid -> record
+        self._page_pending = False
+
+        self._fetch = None         #query mode: fetch(offset, limit, deliver)
+        self._results = []         #records fetched so far in query mode
+        self._source_done = True   #no more pages to fetch
+        self._generation = 0       #bumped by set_source so late pages are dropped
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    @staticmethod
+    def iid_for(record):
+        return str(record.id)
+
+    def set_records(self, records):
+        #Shows a new list (kept by reference; call refresh() after changing it).
+        #In query mode the list is only kept for when set_source(None) is called.
+        self.records = records
+        self.refresh()
+
+    def set_source(self, fetch):
+        #Switches to query mode: fetch(offset, limit, deliver) must get that
+        #slice of the results and call deliver(records) on the Tk thread.
+        #The current rows stay until the first page arrives. set_source(None)
+        #goes back to showing self.records.
+        self._generation += 1
+        self._fetch = fetch
+        self._start = 0
+        self._limit = self.page_size
+        if fetch is None:
+            self._results = []
+            self._source_done = True
+            self._page_pending = False
+            self.refresh()
+        else:
+            self._source_done = False
+            self._fetch_page(0)
+
+    def discard(self, record):
+        #Drops a deleted record from the query results (list mode rows go
+        #away when the record leaves self.records)
+        if record in self._results:
+            self._results.remove(record)
+            self.refresh()
+
+    def _shown(self):
+        return self._results if self._fetch is not None else self.records
+
+    def querying(self):
+        #True while the rows come from set_source's query
+        return self._fetch is not None
+
+    def selected_record(self):
+        #Record for the selected row, or None
+        selected = self.tree.selection()
+        if not selected:
+            return None
+        return self._records_by_iid.get(selected[0])
+
+    @instrument("gui.table_refresh")
+    def refresh(self):
+        #Brings the materialized rows in line with self.records, touching only
+        #rows that were added, removed, changed or moved
+        shown = self._shown()
+        #If the list got shorter, the window moves up to keep rows in it
+        self._start = min(self._start, max(0, len(shown) - self._limit))
+        visible = shown[self._start:self._start + self._limit]
+        wanted = {self.iid_for(r): r for r in visible}
+
+        stale = [iid for iid in self._order if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                del self._values[iid]
+                del self._records_by_iid[iid]
+            self._order = [iid for iid in self._order if iid in wanted]
+
+        for pos, (iid, record) in enumerate(wanted.items()):
+            values = self.row_values(record)
+            if iid not in self._values:
+                self.tree.insert("", pos, iid=iid, values=values)
+                self._order.insert(pos, iid)
+            else:
+                if self._values[iid] != values:
+                    self.tree.item(iid, values=values)
+                if self._order[pos] != iid:
+                    self.tree.move(iid, "", pos)
+                    self._order.remove(iid)
+                    self._order.insert(pos, iid)
+            self._values[iid] = values
+            self._records_by_iid[iid] = record
+
+    def refresh_record(self, record):
+        #Updates a single row in place (no-op if it is not materialized yet)
+        iid = self.iid_for(record)
+        if iid in self._values:
+            values = self.row_values(record)
+            if self._values[iid] != values:
+                self.tree.item(iid, values=values)
+                self._values[iid] = values
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._page_pending:
+            return
+        #Load the next page once the view gets close to the last materialized
+        #row, and the one before once it gets close to the first
+        if float(last) > 0.9:
+            if self._start + self._limit < len(self._shown()):
+                self._page_pending = True
+                self.tree.after_idle(self._slide, self.page_size)
+            elif self._fetch is not None and not self._source_done:
+                self._fetch_page(len(self._results))
+        elif float(first) < 0.1 and self._start > 0:
+            self._page_pending = True
+            self.tree.after_idle(self._slide, -self.page_size)
+
+    def _slide(self, rows):
+        #Materializes rows more records after the window (rows > 0) or -rows
+        #before it, removing as many at the other end as go past WINDOW_PAGES,
+        #and keeps the rows in view where they were
+        self._page_pending = False
+        top = round(self.tree.yview()[0] * len(self._order))   #first row in view
+        start = self._start
+        most = self.page_size * WINDOW_PAGES
+        if rows > 0:
+            self._limit += rows
+            self._start += max(0, self._limit - most)
+        else:
+            self._start = max(0, self._start + rows)
+            self._limit += start - self._start
+        self._limit = min(self._limit, most)
+        self.refresh()
+        if self._order:
+            self.tree.yview_moveto((top + start - self._start) / len(self._order))
+
+    def _fetch_page(self, offset):
+        self._page_pending = True
+        generation = self._generation
+
+        def deliver(records):
+            if generation != self._generation:
+                return  #a newer set_source replaced this query
+            self._page_pending = False
+            self._results[offset:] = records
+            self._source_done = len(records) < self.page_size
+            if offset == 0:
+                self.refresh()
+                self.tree.yview_moveto(0)
+            else:
+                self._slide(len(records))
+
+        self._fetch(offset, self.page_size, deliver)
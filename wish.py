@@ -1,11 +1,37 @@
+_set = object.__setattr__
+
+
 class Wish:
-    def __init__(self, recipient, item, quantity, category, status, date):
-        self.recipient = recipient
-        self.item = item
-        self.quantity = quantity
-        self.category = category
-        self.status = status  # "Pending" or "Fulfilled"
-        self.date = date
+    #Fixed attribute set: no per-instance __dict__, so big lists stay small
+    __slots__ = ("id", "recipient", "item", "quantity", "category", "status", "date", "version", "dirty")
+
+    #Fields that are written to the database; changing one marks the object dirty
+    TRACKED_FIELDS = frozenset(("recipient", "item", "quantity", "category", "status", "date"))
+
+    def __init__(self, recipient, item, quantity, category, status, date, id=None, version=0):
+        #object.__setattr__ skips the dirty check below (and is much faster)
+        _set(self, "id", id)  # database row id (None until saved)
+        _set(self, "recipient", recipient)
+        _set(self, "item", item)
+        _set(self, "quantity", quantity)
+        _set(self, "category", category)
+        _set(self, "status", status)  # "Pending" or "Fulfilled"
+        _set(self, "date", date)
+        _set(self, "version", version)  # row version in the database (see data_manager)
+        _set(self, "dirty", False)  # True when changed since last saved/loaded
+
+    def __setattr__(self, name, value):
+        if name in self.TRACKED_FIELDS:
+            _set(self, "dirty", True)
+        _set(self, name, value)
+
+    def copy_from(self, other):
+        #Takes over the stored values of another copy of the same row (e.g.
+        #one re-read from the database) without marking this one dirty
+        for field in self.TRACKED_FIELDS:
+            _set(self, field, getattr(other, field))
+        _set(self, "version", other.version)
+        _set(self, "dirty", other.dirty)
 
     def to_dict(self):
         #Converts object attributes to a dictionary